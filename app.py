@@ -1,15 +1,21 @@
 import os
 import sys
+import hmac
 import uvicorn
 import logging
-from fastapi import FastAPI, Request, Query
+from fastapi import FastAPI, Request, Query, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict
-import networkx as nx
+from fastapi.responses import PlainTextResponse
+from typing import Dict, Optional
 import time
 
-from utils.geo_utils import load_map_graph, ensure_safety_score_float, geocode_location
-from services.routing import get_route
+from utils.geo_utils import geocode_location
+from services.routing import get_route, get_alternative_routes
+from services.graph_registry import GraphRegistry
+from services.graph_tiles import TiledGraph
+from safety.crime_weights import get_crime_weight_profiles
+from utils.metrics import span, request_trace, render_metrics, REQUEST_LATENCY, REQUESTS
+from utils.route_encoding import FORMATS, render_routes_response
 
 # === Initialize FastAPI app with enhanced metadata ===
 app = FastAPI(
@@ -53,37 +59,72 @@ logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
-# === Access log middleware ===
+# Paths reported as metric labels; anything else is counted as "other" to bound label cardinality
+METRIC_PATHS = {"/", "/health", "/route", "/route_coords", "/metrics", "/admin/graph", "/admin/graph/reload"}
+
+# === Access log and request metrics middleware ===
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    start_time = time.time()
+    start_time = time.perf_counter()
     response = await call_next(request)
-    process_time = (time.time() - start_time) * 1000  # in milliseconds
+    process_time = time.perf_counter() - start_time
 
-    client_ip = request.client.host
-    method = request.method
-    url = str(request.url)
-    status_code = response.status_code
+    path = request.url.path if request.url.path in METRIC_PATHS else "other"
+    REQUEST_LATENCY.observe(process_time, path=path)
+    REQUESTS.inc(path=path, status=response.status_code)
 
-    logging.info(f"{client_ip} - \"{method} {url}\" {status_code} - {process_time:.2f}ms")
+    logging.info(
+        "%s - \"%s %s\" %s - %.2fms",
+        request.client.host, request.method, request.url, response.status_code, process_time * 1000
+    )
 
     return response
 
 # === Path configuration (use graph with merged recent crime data) ===
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-GRAPH_PATH = os.path.join(BASE_DIR, "cache_london", "london_safety_score_recent.graphml")
+GRAPH_PATH = os.environ.get("GRAPH_PATH", os.path.join(BASE_DIR, "cache_london", "london_safety_score_recent.graphml"))
+
+# === Hot reload configuration ===
+# Seconds between checks of GRAPH_PATH for a refreshed graph (0 disables the watcher)
+GRAPH_WATCH_INTERVAL = float(os.environ.get("GRAPH_WATCH_INTERVAL", "60"))
+# Token required by the admin endpoints in the X-Admin-Token header
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+# === Tiled mode: route over on-demand graph tiles instead of the whole graph ===
+# Directory written by `services/graph_tiles.py`; unset keeps the whole graph in memory
+GRAPH_TILES_DIR = os.environ.get("GRAPH_TILES_DIR")
+GRAPH_MAX_TILES = int(os.environ.get("GRAPH_MAX_TILES", "64"))
+# Largest region (in tiles) a query may route over, and the edge budget of the resident tile graph
+GRAPH_MAX_REGION_TILES = int(os.environ.get("GRAPH_MAX_REGION_TILES", "0")) or None
+GRAPH_REGION_CACHE_EDGES = int(os.environ.get("GRAPH_REGION_CACHE_EDGES", "2000000"))
 
-# === Global graph object ===
-G: nx.MultiDiGraph = None
+# === Versioned graph registry (replaces the global graph object) ===
+registry = GraphRegistry(GRAPH_PATH)
+tiles: Optional[TiledGraph] = None
 
 # === Load graph when FastAPI starts ===
 @app.on_event("startup")
 def load_graph_on_startup():
-    global G
+    global tiles
+    if GRAPH_TILES_DIR:
+        tiles = TiledGraph(
+            GRAPH_TILES_DIR,
+            max_tiles=GRAPH_MAX_TILES,
+            max_region_tiles=GRAPH_MAX_REGION_TILES,
+            max_cached_edges=GRAPH_REGION_CACHE_EDGES,
+        )
+        logging.info("Serving graph tiles from %s: %s", GRAPH_TILES_DIR, tiles.status())
+        return
+
     logging.info("Loading London map data...")
-    G = load_map_graph(GRAPH_PATH)
-    ensure_safety_score_float(G)
-    logging.info("Map loaded successfully.")
+    snapshot = registry.load()
+    logging.info(f"Map loaded successfully. Graph version: {snapshot.version}")
+    if GRAPH_WATCH_INTERVAL > 0:
+        registry.start_watching(GRAPH_WATCH_INTERVAL)
+
+@app.on_event("shutdown")
+def stop_graph_watcher():
+    registry.stop_watching()
 
 # === Root endpoint for testing ===
 @app.get("/")
@@ -96,33 +137,144 @@ def health_check():
     """
     Health check endpoint to confirm API is alive.
     """
-    return {"status": "ok"}
+    if tiles is not None:
+        return {"status": "ok", "graph_version": tiles.version, "tiles": tiles.status()}
+
+    status = registry.status()
+    return {
+        "status": "ok",
+        "graph_version": status["current"]["version"] if status["current"] else None,
+    }
+
+# === Prometheus metrics ===
+@app.get("/metrics", tags=["Health"])
+def metrics():
+    """
+    Request and per-stage latency histograms, search and cache counters in Prometheus format.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+# === Admin: graph registry status and hot reload ===
+def check_admin_token(token: Optional[str]):
+    if ADMIN_TOKEN is None:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN not set)")
+    if token is None or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.get("/admin/graph", tags=["Admin"])
+def graph_status(x_admin_token: Optional[str] = Header(None)):
+    """
+    Report the graph version being served and the state of any reload.
+    """
+    check_admin_token(x_admin_token)
+    if tiles is not None:
+        return {"tiles": tiles.status()}
+    return registry.status()
+
+@app.post("/admin/graph/reload", tags=["Admin"], status_code=202)
+def reload_graph(x_admin_token: Optional[str] = Header(None)):
+    """
+    Load GRAPH_PATH in the background and swap it in once validated.
+    Requests keep being served by the current version meanwhile.
+    """
+    check_admin_token(x_admin_token)
+    if tiles is not None:
+        raise HTTPException(status_code=409, detail="Hot reload is not available in tiled mode; rebuild the tiles and restart")
+    started = registry.reload_async()
+    return {"reload_started": started, **registry.status()}
+
+PROFILE_DESCRIPTION = f"Safety weight profile: {', '.join(get_crime_weight_profiles())}"
+
+def build_routes_response(start_coords, end_coords, alternatives: int = 0, profile: str = "default") -> Dict:
+    """
+    Compute the shortest, safest and hybrid routes, plus up to `alternatives`
+    diverse hybrid routes when requested.
+    All routes of one response come from the same graph version; `profile`
+    only selects which safety score column the searches read.
+    """
+    if profile not in get_crime_weight_profiles():
+        return {"error": f"Unknown profile '{profile}'. Available: {', '.join(get_crime_weight_profiles())}"}
+
+    def compute_routes(G):
+        result = {
+            "shortest": get_route(G, start_coords, end_coords, weight="length"),
+            "safest": get_route(G, start_coords, end_coords, weight="safety_score", profile=profile),
+        }
+        if alternatives <= 0:
+            result["hybrid"] = get_route(G, start_coords, end_coords, weight="hybrid", profile=profile)
+            return result
+
+        # The first alternative is always the hybrid optimum, so it doubles as
+        # the hybrid route instead of searching for it a second time
+        routes = get_alternative_routes(G, start_coords, end_coords, weight="hybrid", k=alternatives, profile=profile)
+        if "routes" in routes:
+            result["hybrid"] = {key: value for key, value in routes["routes"][0].items() if key != "overlap"}
+        else:
+            result["hybrid"] = routes
+        result["alternatives"] = routes
+        return result
+
+    def missing_profile(available):
+        return {
+            "error": f"Profile '{profile}' is not in the loaded graph (available: {', '.join(available) or 'none'}). "
+                     "Regenerate it with `generate_safety_graph.py`."
+        }
+
+    if tiles is not None:
+        if profile not in tiles.profiles:
+            return missing_profile(tiles.profiles)
+        return {"graph_version": tiles.version, "profile": profile, **tiles.route(start_coords, end_coords, compute_routes)}
+
+    snapshot = registry.current()
+    if profile not in snapshot.profiles:
+        return missing_profile(snapshot.profiles)
+    return {"graph_version": snapshot.version, "profile": profile, **compute_routes(snapshot.graph)}
+
+FORMAT_DESCRIPTION = (
+    "Route geometry encoding: json (lat/lon lists), polyline (Google encoded polyline) or "
+    "binary (base64 delta-encoded microdegrees). Compact formats store stretches shared "
+    "by several routes once, in `segments`."
+)
+
+def encoded_response(result: Dict, fmt: str, accept_encoding: Optional[str]):
+    """
+    Serialize a routes response in the negotiated format and compression,
+    bypassing FastAPI's jsonable_encoder; timed as the `serialize` stage.
+    """
+    if fmt not in FORMATS:
+        result = {"error": f"Unknown format '{fmt}'. Available: {', '.join(FORMATS)}"}
+        fmt = "json"
+    with span("serialize"):
+        return render_routes_response(result, fmt, accept_encoding)
 
 # === Get routes by place names ===
 @app.get("/route")
 def get_safe_routes(
     start_place: str = Query(..., description="Start location name (e.g., King's Cross Station)"),
-    end_place: str = Query(..., description="End location name (e.g., London Eye)")
+    end_place: str = Query(..., description="End location name (e.g., London Eye)"),
+    alternatives: int = Query(0, ge=0, le=5, description="Number of diverse alternative routes to add (0 = none)"),
+    profile: str = Query("default", description=PROFILE_DESCRIPTION),
+    format: str = Query("json", description=FORMAT_DESCRIPTION),
+    accept_encoding: Optional[str] = Header(None)
 ) -> Dict:
-    start_loc = geocode_location(start_place)
-    end_loc = geocode_location(end_place)
+    with request_trace("/route"):
+        with span("geocode"):
+            start_loc = geocode_location(start_place)
+            end_loc = geocode_location(end_place)
 
-    if "error" in start_loc:
-        return {"error": f"Start location error: {start_loc['error']}"}
-    if "error" in end_loc:
-        return {"error": f"End location error: {end_loc['error']}"}
+        if "error" in start_loc:
+            return {"error": f"Start location error: {start_loc['error']}"}
+        if "error" in end_loc:
+            return {"error": f"End location error: {end_loc['error']}"}
 
-    start_coords = (start_loc["latitude"], start_loc["longitude"])
-    end_coords = (end_loc["latitude"], end_loc["longitude"])
+        start_coords = (start_loc["latitude"], start_loc["longitude"])
+        end_coords = (end_loc["latitude"], end_loc["longitude"])
 
-    logging.info(f"Calculating routes from {start_place} to {end_place}")
-    logging.info(f"Start coords: {start_coords}, End coords: {end_coords}")
+        logging.debug("Calculating routes from %s %s to %s %s", start_place, start_coords, end_place, end_coords)
 
-    return {
-        "shortest": get_route(G, start_coords, end_coords, weight="length"),
-        "safest": get_route(G, start_coords, end_coords, weight="safety_score"),
-        "hybrid": get_route(G, start_coords, end_coords, weight="hybrid"),
-    }
+        return encoded_response(
+            build_routes_response(start_coords, end_coords, alternatives, profile), format, accept_encoding
+        )
 
 # === Get routes by coordinates ===
 @app.get("/route_coords")
@@ -131,17 +283,20 @@ def get_safe_routes_by_coords(
     start_lon: float = Query(..., description="Start longitude"),
     end_lat: float = Query(..., description="End latitude"),
     end_lon: float = Query(..., description="End longitude"),
+    alternatives: int = Query(0, ge=0, le=5, description="Number of diverse alternative routes to add (0 = none)"),
+    profile: str = Query("default", description=PROFILE_DESCRIPTION),
+    format: str = Query("json", description=FORMAT_DESCRIPTION),
+    accept_encoding: Optional[str] = Header(None),
 ) -> Dict:
-    start_coords = (start_lat, start_lon)
-    end_coords = (end_lat, end_lon)
+    with request_trace("/route_coords"):
+        start_coords = (start_lat, start_lon)
+        end_coords = (end_lat, end_lon)
 
-    logging.info(f"Calculating routes from {start_coords} to {end_coords}")
+        logging.debug("Calculating routes from %s to %s", start_coords, end_coords)
 
-    return {
-        "shortest": get_route(G, start_coords, end_coords, weight="length"),
-        "safest": get_route(G, start_coords, end_coords, weight="safety_score"),
-        "hybrid": get_route(G, start_coords, end_coords, weight="hybrid"),
-    }
+        return encoded_response(
+            build_routes_response(start_coords, end_coords, alternatives, profile), format, accept_encoding
+        )
 
 # === Run the server (use 0.0.0.0 for LAN access) ===
 if __name__ == "__main__":
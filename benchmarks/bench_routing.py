@@ -0,0 +1,283 @@
+"""
+Routing benchmark suite.
+
+Measures, on a seeded synthetic grid city (offline) or a real London safety graph:
+  - cold start: GraphML load + safety_score conversion, and its peak RSS (in a fresh process)
+  - per-weight query latency percentiles for `get_route` and `get_alternative_routes`
+  - node snapping throughput (single lookups and batched)
+  - peak RSS of the benchmark process
+
+Results are written as JSON and can be compared against a stored baseline:
+
+    python benchmarks/bench_routing.py --size 100 --save-baseline
+    python benchmarks/bench_routing.py --size 100 --compare
+    python benchmarks/bench_routing.py --graph cache_london/london_safety_score_recent.graphml --compare
+"""
+import os
+import sys
+import io
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import contextlib
+import importlib.util
+import numpy as np
+import osmnx as ox
+
+# Add project root to sys.path
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(BASE_DIR, "..")))
+
+from utils.geo_utils import load_map_graph, ensure_safety_score_float
+from services.routing import get_route, get_alternative_routes, snap_to_nodes
+from benchmarks.synthetic_city import make_grid_city, random_queries
+
+RESULTS_FILE = os.path.join(BASE_DIR, "results.json")
+BASELINE_FILE = os.path.join(BASE_DIR, "baseline.json")
+WEIGHTS = ["length", "safety_score", "hybrid"]
+
+# Metrics where a larger value is an improvement; everything else is "lower is better"
+HIGHER_IS_BETTER = ("_per_s",)
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """Peak resident set size in MB (ru_maxrss is KB on Linux, bytes on macOS)"""
+    rss = resource.getrusage(who).ru_maxrss
+    return rss / (1024 * 1024) if platform.system() == "Darwin" else rss / 1024
+
+
+def percentiles(samples_s):
+    """Latency summary in milliseconds"""
+    ms = np.asarray(samples_s) * 1000
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+        "max_ms": float(ms.max()),
+    }
+
+
+@contextlib.contextmanager
+def quiet():
+    """Swallow the routing code's progress prints so they don't dominate the timings"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def load_child(graph_path):
+    """Entry point of the cold start subprocess: load the graph the way the API does"""
+    start = time.perf_counter()
+    with quiet():
+        graph = load_map_graph(graph_path)
+        ensure_safety_score_float(graph)
+    load_s = time.perf_counter() - start
+    print(json.dumps({
+        "load_s": load_s,
+        "peak_rss_mb": peak_rss_mb(),
+        "nodes": graph.number_of_nodes(),
+        "edges": graph.number_of_edges(),
+    }))
+
+
+def bench_cold_start(graph_path):
+    """Time a graph load in a fresh interpreter so import caches and earlier allocations don't skew it"""
+    start = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--load-child", graph_path],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    result = json.loads(out.strip().splitlines()[-1])
+    result["process_s"] = time.perf_counter() - start
+    return result
+
+
+def bench_queries(graph, queries, weights, alternatives):
+    results = {}
+    for weight in weights:
+        samples, errors = [], 0
+        for orig, dest in queries:
+            start = time.perf_counter()
+            route = get_route(graph, orig, dest, weight=weight)
+            samples.append(time.perf_counter() - start)
+            errors += "error" in route
+        results[weight] = {**percentiles(samples), "errors": errors}
+
+    if alternatives > 0:
+        samples, errors = [], 0
+        for orig, dest in queries:
+            start = time.perf_counter()
+            routes = get_alternative_routes(graph, orig, dest, weight="hybrid", k=alternatives)
+            samples.append(time.perf_counter() - start)
+            errors += "error" in routes
+        results[f"alternatives_k{alternatives}"] = {**percentiles(samples), "errors": errors}
+
+    return results
+
+
+def bench_snapping(graph, queries, repeat=3):
+    points = [p for pair in queries for p in pair]
+    lats = [p[0] for p in points]
+    lons = [p[1] for p in points]
+
+    # The first call builds the cached spatial index; time it separately from steady state
+    start = time.perf_counter()
+    snap_to_nodes(graph, points[:1])
+    first_call_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for point in points:
+            snap_to_nodes(graph, [point])
+    single_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        snap_to_nodes(graph, points)
+    batch_s = time.perf_counter() - start
+
+    total = len(points) * repeat
+    results = {
+        "first_call_ms": first_call_s * 1000,
+        "single_points_per_s": total / single_s,
+        "batch_points_per_s": total / batch_s,
+    }
+
+    # osmnx's nearest_nodes rebuilds its index on every call, for comparison.
+    # On an unprojected graph it needs scikit-learn, which the app itself doesn't
+    if importlib.util.find_spec("sklearn") is None:
+        print("  scikit-learn not installed, skipping the osmnx nearest_nodes comparison")
+    else:
+        start = time.perf_counter()
+        ox.distance.nearest_nodes(graph, lons, lats)
+        results["osmnx_batch_points_per_s"] = len(points) / (time.perf_counter() - start)
+
+    return results
+
+
+def flatten(results, prefix=""):
+    """Flatten nested result dicts into {"a.b.c": number} for baseline comparison"""
+    metrics = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            metrics.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[name] = value
+    return metrics
+
+
+def compare(results, baseline, tolerance):
+    """Print current vs baseline for every timing/memory metric; return the regressed ones"""
+    current, base = flatten(results["metrics"]), flatten(baseline["metrics"])
+    if results["workload"] != baseline["workload"]:
+        print(f"Warning: workload differs from baseline ({baseline['workload']})")
+
+    regressions = []
+    print(f"\n{'metric':<45} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name in sorted(current.keys() & base.keys()):
+        old, new = base[name], current[name]
+        if old == 0 or name.endswith("errors") or name.endswith(("nodes", "edges")):
+            continue
+        change = (new - old) / old
+        higher_better = name.endswith(HIGHER_IS_BETTER)
+        regressed = change < -tolerance if higher_better else change > tolerance
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<45} {old:>12.3f} {new:>12.3f} {change:>+8.1%}{flag}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark routing, node snapping and graph loading")
+    parser.add_argument("--graph", help="GraphML safety graph to benchmark (default: synthetic grid city)")
+    parser.add_argument("--size", type=int, default=100, help="Synthetic grid side length in nodes")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for the synthetic graph and queries")
+    parser.add_argument("--queries", type=int, default=50, help="Number of start/end pairs")
+    parser.add_argument("--alternatives", type=int, default=3, help="k for the alternatives benchmark (0 skips it)")
+    parser.add_argument("--output", default=RESULTS_FILE, help="Where to write the JSON results")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline JSON to compare against / save to")
+    parser.add_argument("--save-baseline", action="store_true", help="Also store these results as the baseline")
+    parser.add_argument("--compare", action="store_true", help="Compare with the baseline, exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative slowdown before failing")
+    parser.add_argument("--load-child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.load_child:
+        load_child(args.load_child)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.graph:
+            graph_path = os.path.abspath(args.graph)
+            workload = {"graph": os.path.basename(graph_path), "queries": args.queries, "seed": args.seed}
+        else:
+            print(f"Generating synthetic {args.size}x{args.size} grid city (seed {args.seed})...")
+            graph_path = os.path.join(tmp_dir, "synthetic_city.graphml")
+            ox.save_graphml(make_grid_city(args.size, args.size, seed=args.seed), graph_path)
+            workload = {"graph": f"synthetic_{args.size}x{args.size}", "queries": args.queries, "seed": args.seed}
+
+        print("Measuring cold start...")
+        cold_start = bench_cold_start(graph_path)
+
+        with quiet():
+            graph = load_map_graph(graph_path)
+            ensure_safety_score_float(graph)
+
+    print(f"Graph: {graph.number_of_nodes()} nodes, {graph.number_of_edges()} edges")
+    queries = random_queries(graph, args.queries, seed=args.seed)
+
+    print("Measuring node snapping...")
+    snapping = bench_snapping(graph, queries)
+
+    print(f"Measuring {len(queries)} queries per weight...")
+    routing = bench_queries(graph, queries, WEIGHTS, args.alternatives)
+
+    results = {
+        "workload": workload,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "metrics": {
+            "cold_start": cold_start,
+            "snapping": snapping,
+            "routing": routing,
+            "process": {"peak_rss_mb": peak_rss_mb()},
+        },
+    }
+
+    for weight, summary in routing.items():
+        print(f"  {weight:<16} p50 {summary['p50_ms']:8.2f} ms  p99 {summary['p99_ms']:8.2f} ms  errors {summary['errors']}")
+    print(f"  cold start {cold_start['load_s']:.2f}s, {cold_start['peak_rss_mb']:.0f} MB peak RSS")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+
+    if args.compare and not args.save_baseline:
+        if not os.path.exists(args.baseline):
+            print(f"No baseline at {args.baseline}; run with --save-baseline first")
+            sys.exit(1)
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed beyond {args.tolerance:.0%}")
+            sys.exit(1)
+        print("\nNo regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""
+Replay load test for the FastAPI service.
+
+Replays recorded `/route` and `/route_coords` requests (access log lines written by the
+`log_requests` middleware, or a JSONL file of {"path": ..., "params": {...}}), or a
+synthesized mix of London coordinates and place names, against a locally started app
+with the stub geocoder (GEOCODER=stub).
+
+Two load models:
+  - closed loop: `--concurrency 1,4,16` workers each send requests back to back
+  - open loop:   `--rates 5,10,20` requests/s with Poisson arrivals; latency is measured
+                 from the scheduled arrival, so queueing at saturation is not hidden
+
+Each phase reports throughput, latency percentiles and histogram, and error rates.
+
+    python benchmarks/load_test.py --synthetic-graph 60 --rates 2,5,10,20 --duration 30
+    python benchmarks/load_test.py --replay app.log --concurrency 1,4,8
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --rates 10
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+import itertools
+import re
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlencode
+
+# Add project root to sys.path
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(BASE_DIR, ".."))
+sys.path.insert(0, PROJECT_DIR)
+
+from utils.geo_utils import STUB_PLACES
+
+RESULTS_FILE = os.path.join(BASE_DIR, "load_results.json")
+ROUTE_PATHS = ("/route", "/route_coords")
+HISTOGRAM_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf")]
+# Request line as logged by the `log_requests` middleware: ... "GET http://host/route?..." 200 - 12.34ms
+LOG_LINE = re.compile(r'"GET (\S+)"')
+
+# Central London bounding box for synthesized coordinate queries
+MIN_LAT, MAX_LAT = 51.48, 51.54
+MIN_LON, MAX_LON = -0.20, -0.05
+
+
+def load_replay(path):
+    """Read recorded requests as (path, query string) pairs, keeping only the routing endpoints"""
+    requests = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                record = json.loads(line)
+                url = urlsplit(record.get("url", record.get("path", "")))
+                query = urlencode(record["params"]) if "params" in record else url.query
+            else:
+                match = LOG_LINE.search(line)
+                if not match:
+                    continue
+                url = urlsplit(match.group(1))
+                query = url.query
+            if url.path in ROUTE_PATHS:
+                requests.append((url.path, query))
+    return requests
+
+
+def synthesize(count, seed, place_ratio):
+    """A seeded mix of /route (stub geocoder landmarks) and /route_coords (random London points)"""
+    rng = random.Random(seed)
+    places = list(STUB_PLACES)
+    requests = []
+    for _ in range(count):
+        if rng.random() < place_ratio:
+            start, end = rng.sample(places, 2)
+            requests.append(("/route", urlencode({"start_place": start, "end_place": end})))
+        else:
+            requests.append(("/route_coords", urlencode({
+                "start_lat": round(rng.uniform(MIN_LAT, MAX_LAT), 6),
+                "start_lon": round(rng.uniform(MIN_LON, MAX_LON), 6),
+                "end_lat": round(rng.uniform(MIN_LAT, MAX_LAT), 6),
+                "end_lon": round(rng.uniform(MIN_LON, MAX_LON), 6),
+            })))
+    return requests
+
+
+class Client:
+    """One keep-alive HTTP connection per thread"""
+
+    def __init__(self, base_url, timeout):
+        url = urlsplit(base_url)
+        self.host, self.port = url.hostname, url.port or 80
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def _connection(self):
+        if getattr(self.local, "conn", None) is None:
+            self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return self.local.conn
+
+    def get(self, path, query):
+        """Return (status, error kind or None); status is 0 when the request never completed"""
+        conn = self._connection()
+        try:
+            conn.request("GET", f"{path}?{query}")
+            response = conn.getresponse()
+            body = response.read()
+        except Exception as e:
+            conn.close()
+            self.local.conn = None
+            return 0, type(e).__name__
+
+        if response.status >= 400:
+            return response.status, f"http_{response.status}"
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return response.status, "invalid_json"
+        # The API reports routing failures in the body with a 200 status
+        if "error" in payload or any(isinstance(v, dict) and "error" in v for v in payload.values()):
+            return response.status, "route_error"
+        return response.status, None
+
+
+def summarize(samples, wall_s, offered_rate=None):
+    """samples: list of (path, latency_s, error kind or None)"""
+    def stats(rows):
+        if not rows:
+            return {"requests": 0}
+        ms = np.array([r[1] for r in rows]) * 1000
+        errors = {}
+        for r in rows:
+            if r[2]:
+                errors[r[2]] = errors.get(r[2], 0) + 1
+        counts, _ = np.histogram(ms, bins=[0] + HISTOGRAM_BUCKETS_MS)
+        return {
+            "requests": len(rows),
+            "throughput_rps": len(rows) / wall_s,
+            "error_rate": sum(errors.values()) / len(rows),
+            "errors": errors,
+            "p50_ms": float(np.percentile(ms, 50)),
+            "p90_ms": float(np.percentile(ms, 90)),
+            "p99_ms": float(np.percentile(ms, 99)),
+            "max_ms": float(ms.max()),
+            "histogram_ms": {f"le_{b:g}": int(c) for b, c in zip(HISTOGRAM_BUCKETS_MS, counts)},
+        }
+
+    summary = {"wall_s": wall_s, "total": stats(samples)}
+    if offered_rate is not None:
+        summary["offered_rps"] = offered_rate
+    for path in ROUTE_PATHS:
+        rows = [s for s in samples if s[0] == path]
+        if rows:
+            summary[path] = stats(rows)
+    return summary
+
+
+def run_closed_loop(client, requests, concurrency, duration, max_requests):
+    source = itertools.cycle(requests)
+    lock = threading.Lock()
+    samples = []
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        while time.perf_counter() < deadline:
+            with lock:
+                if max_requests and len(samples) >= max_requests:
+                    return
+                path, query = next(source)
+            start = time.perf_counter()
+            _, error = client.get(path, query)
+            with lock:
+                samples.append((path, time.perf_counter() - start, error))
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarize(samples, time.perf_counter() - start)
+
+
+def run_open_loop(client, requests, rate, duration, max_inflight, seed):
+    rng = random.Random(seed)
+    source = itertools.cycle(requests)
+    samples = []
+    lock = threading.Lock()
+
+    def send(path, query, scheduled):
+        _, error = client.get(path, query)
+        with lock:
+            samples.append((path, time.perf_counter() - scheduled, error))
+
+    start = time.perf_counter()
+    next_arrival = start
+    with ThreadPoolExecutor(max_workers=max_inflight) as pool:
+        while True:
+            next_arrival += rng.expovariate(rate)
+            if next_arrival - start >= duration:
+                break
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            path, query = next(source)
+            pool.submit(send, path, query, next_arrival)
+    return summarize(samples, time.perf_counter() - start, offered_rate=rate)
+
+
+def start_server(graph_path, port, workers):
+    """Start the app with uvicorn and the stub geocoder; wait until /health answers"""
+    env = dict(os.environ, GEOCODER="stub", GRAPH_WATCH_INTERVAL="0")
+    if graph_path:
+        env["GRAPH_PATH"] = os.path.abspath(graph_path)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=PROJECT_DIR, env=env,
+    )
+
+    print(f"Starting app on port {port} (waiting for the graph to load)...")
+    deadline = time.time() + 900
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"App exited during startup with code {server.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                return server
+        except OSError:
+            pass
+        time.sleep(1)
+    server.terminate()
+    raise RuntimeError("App did not become healthy in time")
+
+
+def print_phase(label, summary):
+    total = summary["total"]
+    if not total["requests"]:
+        print(f"{label:<22} no requests completed")
+        return
+    print(
+        f"{label:<22} {total['throughput_rps']:8.1f} req/s  p50 {total['p50_ms']:8.1f} ms  "
+        f"p99 {total['p99_ms']:8.1f} ms  errors {total['error_rate']:6.1%}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay or synthesize /route traffic against the API")
+    parser.add_argument("--replay", help="Access log or JSONL file of recorded requests")
+    parser.add_argument("--synthetic-count", type=int, default=500, help="Synthesized requests when not replaying")
+    parser.add_argument("--place-ratio", type=float, default=0.3, help="Share of synthesized requests using /route")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--url", help="Target an already running app instead of starting one")
+    parser.add_argument("--graph", help="GraphML file for the started app (default: the app's GRAPH_PATH)")
+    parser.add_argument("--synthetic-graph", type=int, metavar="SIZE",
+                        help="Start the app on a synthetic SIZE x SIZE grid city instead of London")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the started app")
+    parser.add_argument("--concurrency", default="", help="Closed-loop phases, e.g. 1,4,16")
+    parser.add_argument("--rates", default="", help="Open-loop phases in requests/s, e.g. 5,10,20")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds per phase")
+    parser.add_argument("--max-requests", type=int, default=0, help="Stop a closed-loop phase after N requests")
+    parser.add_argument("--max-inflight", type=int, default=256, help="Open-loop client connection limit")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--slo-ms", type=float, default=1000.0, help="p99 latency above which a rate counts as saturated")
+    parser.add_argument("--output", default=RESULTS_FILE)
+    args = parser.parse_args()
+
+    concurrency_levels = [int(c) for c in args.concurrency.split(",") if c]
+    rates = [float(r) for r in args.rates.split(",") if r]
+    if not concurrency_levels and not rates:
+        concurrency_levels = [1, 4]
+
+    requests = load_replay(args.replay) if args.replay else synthesize(args.synthetic_count, args.seed, args.place_ratio)
+    if not requests:
+        print("No /route or /route_coords requests to replay.")
+        sys.exit(1)
+    print(f"Workload: {len(requests)} requests ({'replay of ' + args.replay if args.replay else 'synthetic'})")
+
+    server = None
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        graph_path = args.graph
+        if args.synthetic_graph:
+            import osmnx as ox
+            from benchmarks.synthetic_city import make_grid_city
+            graph_path = os.path.join(tmp_dir, "synthetic_city.graphml")
+            ox.save_graphml(make_grid_city(args.synthetic_graph, args.synthetic_graph, seed=args.seed), graph_path)
+
+        base_url = args.url
+        if not base_url:
+            server = start_server(graph_path, args.port, args.workers)
+            base_url = f"http://127.0.0.1:{args.port}"
+
+        try:
+            client = Client(base_url, args.timeout)
+            phases = []
+            for concurrency in concurrency_levels:
+                summary = run_closed_loop(client, requests, concurrency, args.duration, args.max_requests)
+                phases.append({"mode": "closed", "concurrency": concurrency, **summary})
+                print_phase(f"closed c={concurrency}", summary)
+            for rate in rates:
+                summary = run_open_loop(client, requests, rate, args.duration, args.max_inflight, args.seed)
+                phases.append({"mode": "open", "rate": rate, **summary})
+                print_phase(f"open {rate:g} req/s", summary)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    # Saturation: first offered rate the service can no longer keep up with, i.e. the
+    # backlog took >10% of the phase to drain or p99 broke the latency objective
+    saturation = None
+    for phase in phases:
+        total = phase["total"]
+        if phase["mode"] == "open" and total["requests"] and (
+            phase["wall_s"] > 1.1 * args.duration or total["p99_ms"] > args.slo_ms
+        ):
+            saturation = phase["rate"]
+            break
+    if rates:
+        print(f"Saturation: {f'{saturation:g} req/s' if saturation else 'not reached'}")
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "workload": {"replay": args.replay, "requests": len(requests), "seed": args.seed},
+            "phases": phases,
+            "saturation_rps": saturation,
+        }, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
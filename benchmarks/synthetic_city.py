@@ -0,0 +1,110 @@
+import math
+import itertools
+import numpy as np
+import networkx as nx
+
+# Centre of the synthetic city (Charing Cross), so coordinates look like London's
+CENTER_LAT, CENTER_LON = 51.5074, -0.1278
+METERS_PER_DEG_LAT = 111_320.0
+
+
+def _haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in meters"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6_371_009 * math.asin(math.sqrt(a))
+
+
+def make_grid_city(rows=100, cols=100, spacing_m=80.0, seed=42, drop_prob=0.08, diagonal_prob=0.05, hotspots=25):
+    """
+    Build a seeded grid-city walking graph shaped like the safety graph
+    produced by `generate_safety_graph.py`, so benchmarks run without an OSM download.
+
+    - Nodes sit on a jittered `rows` x `cols` grid around central London.
+    - Streets are two-way; a fraction is dropped and a few diagonal shortcuts
+      are added so routes are not all ties.
+    - `safety_score` (0–10) comes from Gaussian crime hotspots, and the
+      `safety_score_day` / `safety_score_night` profile columns are derived from it.
+    """
+    rng = np.random.default_rng(seed)
+    meters_per_deg_lon = METERS_PER_DEG_LAT * math.cos(math.radians(CENTER_LAT))
+
+    graph = nx.MultiDiGraph(crs="epsg:4326", name="synthetic_grid_city", seed=seed)
+
+    def node_id(r, c):
+        return r * cols + c
+
+    for r in range(rows):
+        for c in range(cols):
+            dy = (r - rows / 2) * spacing_m + rng.normal(0, spacing_m * 0.1)
+            dx = (c - cols / 2) * spacing_m + rng.normal(0, spacing_m * 0.1)
+            n = node_id(r, c)
+            graph.add_node(
+                n,
+                osmid=n,
+                y=CENTER_LAT + dy / METERS_PER_DEG_LAT,
+                x=CENTER_LON + dx / meters_per_deg_lon,
+                street_count=4,
+            )
+
+    # Crime hotspots: (row, col, radius in cells, intensity)
+    spots = [
+        (rng.uniform(0, rows), rng.uniform(0, cols), rng.uniform(2, 10), rng.uniform(3, 10))
+        for _ in range(hotspots)
+    ]
+
+    def crime_score(r, c):
+        risk = sum(i * math.exp(-((r - sr) ** 2 + (c - sc) ** 2) / (2 * rad ** 2)) for sr, sc, rad, i in spots)
+        return min(risk, 10.0)
+
+    # A running id: number_of_edges() walks every adjacency dict on a MultiDiGraph
+    street_ids = itertools.count()
+
+    def add_street(u, v, r, c):
+        ud, vd = graph.nodes[u], graph.nodes[v]
+        length = round(_haversine_m(ud["y"], ud["x"], vd["y"], vd["x"]), 3)
+        score = round(1.0 + 0.9 * crime_score(r, c), 2)
+        noise = rng.uniform(0.8, 1.2)
+        attrs = {
+            "osmid": next(street_ids),
+            "highway": "residential",
+            "oneway": False,
+            "length": length,
+            "safety_score": score,
+            "safety_score_day": round(min(score * 0.8 * noise, 10.0), 2),
+            "safety_score_night": round(min(score * 1.25 * noise, 10.0), 2),
+        }
+        graph.add_edge(u, v, **attrs)
+        graph.add_edge(v, u, **attrs)
+
+    for r in range(rows):
+        for c in range(cols):
+            if c + 1 < cols and rng.random() >= drop_prob:
+                add_street(node_id(r, c), node_id(r, c + 1), r, c + 0.5)
+            if r + 1 < rows and rng.random() >= drop_prob:
+                add_street(node_id(r, c), node_id(r + 1, c), r + 0.5, c)
+            if r + 1 < rows and c + 1 < cols and rng.random() < diagonal_prob:
+                add_street(node_id(r, c), node_id(r + 1, c + 1), r + 0.5, c + 0.5)
+
+    # Keep only the largest connected piece, like a downloaded walking network
+    largest = max(nx.weakly_connected_components(graph), key=len)
+    return graph.subgraph(largest).copy()
+
+
+def random_queries(graph, count, seed=0, min_distance_m=500.0):
+    """
+    Seeded (lat, lon) start/end pairs inside the graph's bounding box,
+    at least `min_distance_m` apart so every query does real search work.
+    """
+    rng = np.random.default_rng(seed)
+    ys = [d["y"] for _, d in graph.nodes(data=True)]
+    xs = [d["x"] for _, d in graph.nodes(data=True)]
+    min_y, max_y, min_x, max_x = min(ys), max(ys), min(xs), max(xs)
+
+    queries = []
+    while len(queries) < count:
+        start = (rng.uniform(min_y, max_y), rng.uniform(min_x, max_x))
+        end = (rng.uniform(min_y, max_y), rng.uniform(min_x, max_x))
+        if _haversine_m(start[0], start[1], end[0], end[1]) >= min_distance_m:
+            queries.append((start, end))
+    return queries
@@ -10,7 +10,20 @@ cd "$(dirname "$0")"
 # Step 1: Delete old files
 python3 delete.py
 
-# Step 2: Generate new graph
-python3 services/generate_safety_graph.py
+# Step 2: Prune and simplify the downloaded walking network
+python3 services/prune_graph.py
+
+# Step 3: Generate new graph
+if ! python3 services/generate_safety_graph.py --input Map_download/london_pruned.graphml; then
+    echo "Graph generation failed; the published graph is left unchanged."
+    exit 1
+fi
+
+# Step 4: Publish it to the file the API watches (same default as app.py's GRAPH_PATH).
+# Copy next to the target, then rename over it, so the API never loads a half-copied graph
+PUBLISHED_GRAPH="${GRAPH_PATH:-cache_london/london_safety_score_recent.graphml}"
+cp cache_london/london_safety_score.graphml "$PUBLISHED_GRAPH.tmp"
+mv -f "$PUBLISHED_GRAPH.tmp" "$PUBLISHED_GRAPH"
+echo "Published to $PUBLISHED_GRAPH"
 
 echo "London safety graph refresh complete!"
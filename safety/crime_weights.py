@@ -19,3 +19,63 @@ def get_crime_weights():
         "Shoplifting": 1.5,
         "Bicycle theft": 1.2,
     }
+
+
+def get_crime_weight_profiles():
+    """
+    Returns the crime type weight profiles the safety graph is scored with.
+    Each profile becomes its own safety score column over the same graph;
+    "default" is stored as `safety_score`, the others as `safety_score_<name>`.
+    Police data has no time of day, so the time bands re-weight crime types
+    by how much they matter to a pedestrian at that time.
+    """
+    return {
+        "default": get_crime_weights(),
+        "day": {
+            "Violence and sexual offences": 4.5,
+            "Robbery": 4.0,
+            "Possession of weapons": 3.8,
+            "Theft from the person": 4.5,
+            "Criminal damage and arson": 2.5,
+            "Burglary": 2.5,
+            "Vehicle crime": 2.5,
+            "Drugs": 2.0,
+            "Other crime": 2.0,
+            "Public order": 2.0,
+            "Anti-social behaviour": 2.0,
+            "Other theft": 2.5,
+            "Shoplifting": 2.0,
+            "Bicycle theft": 1.5,
+        },
+        "night": {
+            "Violence and sexual offences": 6.0,
+            "Robbery": 5.5,
+            "Possession of weapons": 5.0,
+            "Theft from the person": 4.0,
+            "Criminal damage and arson": 3.5,
+            "Burglary": 3.0,
+            "Vehicle crime": 2.5,
+            "Drugs": 3.0,
+            "Other crime": 2.5,
+            "Public order": 3.0,
+            "Anti-social behaviour": 3.0,
+            "Other theft": 1.5,
+            "Shoplifting": 0.5,
+            "Bicycle theft": 1.0,
+        },
+    }
+
+
+def get_safety_score_attribute(profile="default"):
+    """Return the edge attribute holding the safety score for a weight profile"""
+    if profile in (None, "default"):
+        return "safety_score"
+    return f"safety_score_{profile}"
+
+
+def get_profiles_from_attributes(attrs):
+    """Return the weight profiles whose safety score columns are among the edge attributes `attrs`"""
+    return sorted(
+        "default" if attr == "safety_score" else attr[len("safety_score_"):]
+        for attr in attrs if attr.startswith("safety_score")
+    )
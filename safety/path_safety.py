@@ -20,6 +20,7 @@ class PathSafetyEvaluator:
         self.max_crime_distance = max_crime_distance  # Query radius (meters)
         self.kdtree = None
         self.crime_data_dict = {}
+        self.crime_locations = []
 
     def build_kdtree(self, crime_data):
         """
@@ -29,35 +30,57 @@ class PathSafetyEvaluator:
             logging.warning("No crime data available, KDTree will not be built")
             return
         self.crime_data_dict = crime_data
-        self.kdtree = KDTree(list(crime_data.keys()))
+        self.crime_locations = list(crime_data.keys())
+        self.kdtree = KDTree(self.crime_locations)
 
-    def find_nearest_weighted_score(self, lat, lon):
+    def find_nearest_crimes(self, lat, lon):
         """
-        Find the nearest crime point to the given location and return its weighted score (not normalized)
+        Find the crime counts of the nearest crime point to the given location, or None if out of range
         """
         if self.kdtree is None or not self.crime_data_dict:
-            return 0.0
+            return None
 
         lat, lon = round(lat, 6), round(lon, 6)
         dist, idx = self.kdtree.query([(lat, lon)], k=1)
-        idx = int(idx[0])
-        nearest_loc = list(self.crime_data_dict.keys())[idx]
-        dist = dist[0]
+        nearest_loc = self.crime_locations[int(idx[0])]
+
+        if dist[0] > self.max_crime_distance:
+            return None
 
-        if dist > self.max_crime_distance:
+        return self.crime_data_dict[nearest_loc]
+
+    def find_nearest_weighted_score(self, lat, lon, weights=None):
+        """
+        Find the nearest crime point to the given location and return its weighted score (not normalized)
+        """
+        crimes = self.find_nearest_crimes(lat, lon)
+        if not crimes:
             return 0.0
 
-        crimes = self.crime_data_dict[nearest_loc]
-        weights = get_crime_weights()
+        weights = weights or get_crime_weights()
 
         weighted_score = sum(
             count * weights.get(crime_type, 1)
             for crime_type, count in crimes.items()
         )
 
-        # print(f"Query point: ({lat}, {lon}), nearest crime point: {nearest_loc}, distance: {dist:.2f}m, raw score: {weighted_score:.2f}")
+        # print(f"Query point: ({lat}, {lon}), raw score: {weighted_score:.2f}")
         return weighted_score
 
+    def find_nearest_weighted_scores(self, lat, lon, profiles):
+        """
+        Weighted scores (not normalized) of the nearest crime point for several weight profiles
+        with a single KDTree query. profiles: {profile_name: {crime_type: weight, ...}}
+        """
+        crimes = self.find_nearest_crimes(lat, lon)
+        if not crimes:
+            return {name: 0.0 for name in profiles}
+
+        return {
+            name: sum(count * weights.get(crime_type, 1) for crime_type, count in crimes.items())
+            for name, weights in profiles.items()
+        }
+
     def get_total_weighted_score(self, path_coordinates, crime_data):
         """
         Compute the total weighted score across all points on the path (not normalized)
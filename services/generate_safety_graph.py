@@ -2,6 +2,7 @@ import os
 import sys
 import pickle
 import time
+import argparse
 import networkx as nx
 import osmnx as ox
 from tqdm import tqdm
@@ -12,10 +13,12 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, os.path.abspath(os.path.join(BASE_DIR, "..")))
 
 from safety.path_safety import PathSafetyEvaluator
+from safety.crime_weights import get_crime_weight_profiles, get_safety_score_attribute
 
 # === Path configuration ===
 CACHE_DIR = os.path.join(BASE_DIR, "..", "cache_london")
-GRAPH_FILE = os.path.join(BASE_DIR, "..", "Map_download", "london.graphml")
+RAW_GRAPH_FILE = os.path.join(BASE_DIR, "..", "Map_download", "london.graphml")
+PRUNED_GRAPH_FILE = os.path.join(BASE_DIR, "..", "Map_download", "london_pruned.graphml")
 UPDATED_GRAPH_FILE = os.path.join(CACHE_DIR, "london_safety_score.graphml")
 CRIME_DATA_FILE = os.path.join(CACHE_DIR, "crime_type_data_london.pkl")
 
@@ -24,18 +27,31 @@ os.makedirs(CACHE_DIR, exist_ok=True)
 # === Parallel processing parameters ===
 NUM_WORKERS = 16
 BATCH_SIZE = 10_000
-MAX_SCORE = 300.0  # Can be adjusted based on actual crime score distribution (for normalizing to 0–10)
-
-def load_data():
-    if not os.path.exists(GRAPH_FILE):
-        print(f"Map file does not exist: {GRAPH_FILE}")
+MAX_SCORE = 300.0  # Raw crime score that maps to the top of the 1–10 scale; adjust to the actual distribution
+
+def default_graph_file():
+    """
+    Input map when `--input` is not given: the output of `prune_graph.py` if it
+    is at least as new as the raw download, otherwise the raw download, so a
+    fresh download is never scored through a stale pruned graph.
+    """
+    if os.path.exists(PRUNED_GRAPH_FILE) and (
+        not os.path.exists(RAW_GRAPH_FILE)
+        or os.path.getmtime(PRUNED_GRAPH_FILE) >= os.path.getmtime(RAW_GRAPH_FILE)
+    ):
+        return PRUNED_GRAPH_FILE
+    return RAW_GRAPH_FILE
+
+def load_data(graph_file):
+    if not os.path.exists(graph_file):
+        print(f"Map file does not exist: {graph_file}")
         sys.exit(1)
     if not os.path.exists(CRIME_DATA_FILE):
         print(f"Crime data file does not exist: {CRIME_DATA_FILE}")
         sys.exit(1)
 
-    print("Loading map...")
-    graph = ox.load_graphml(GRAPH_FILE)
+    print(f"Loading map: {graph_file}")
+    graph = ox.load_graphml(graph_file)
     print(f"Map loaded. Nodes: {graph.number_of_nodes()}, Edges: {graph.number_of_edges()}")
 
     print("Loading crime data...")
@@ -44,8 +60,27 @@ def load_data():
 
     return graph, crime_data
 
-def compute_safety_for_edge(u, v, key, data, graph, evaluator, counter=None):
+def compute_merged_safety(data, evaluator, profiles, merged_edges):
+    """
+    Safety scores of an edge contracted from `merged_edges` street segments by
+    `prune_graph.py`: score one point per original segment along the merged
+    geometry and sum them, so contraction keeps the path's total safety cost.
+    """
+    geometry = data["geometry"]
+    totals = {get_safety_score_attribute(profile): 0.0 for profile in profiles}
+    for i in range(merged_edges):
+        point = geometry.interpolate((i + 0.5) / merged_edges, normalized=True)
+        raw_scores = evaluator.find_nearest_weighted_scores(point.y, point.x, profiles)
+        for profile, raw_score in raw_scores.items():
+            totals[get_safety_score_attribute(profile)] += evaluator.normalize_score(raw_score, max_score=MAX_SCORE)
+    return {attr: round(total, 2) for attr, total in totals.items()}
+
+def compute_safety_for_edge(u, v, key, data, graph, evaluator, profiles, counter=None):
     lat, lon = None, None
+    merged_edges = int(data.get("merged_edges", 1))
+
+    if merged_edges > 1 and hasattr(data.get("geometry"), "interpolate"):
+        return (u, v, key, compute_merged_safety(data, evaluator, profiles, merged_edges))
 
     if "geometry" in data and hasattr(data["geometry"], "xy"):
         lat = data["geometry"].xy[1][0]
@@ -56,21 +91,26 @@ def compute_safety_for_edge(u, v, key, data, graph, evaluator, counter=None):
         lat = (lat1 + lat2) / 2
         lon = (lon1 + lon2) / 2
 
+    # One score per weight profile, stored as separate edge attributes over the same topology
+    scores = {}
     if lat and lon:
-        raw_score = evaluator.find_nearest_weighted_score(lat, lon)
-        normalized = evaluator.normalize_score(raw_score, max_score=MAX_SCORE)
-        safety_score = round(min(normalized * 10, 10.0), 2)  # Ensure score stays in 0–10 range
+        raw_scores = evaluator.find_nearest_weighted_scores(lat, lon, profiles)
+        for profile, raw_score in raw_scores.items():
+            # normalize_score already maps onto 1–10; scaling it again saturated every edge at 10
+            scores[get_safety_score_attribute(profile)] = evaluator.normalize_score(raw_score, max_score=MAX_SCORE)
     else:
-        safety_score = 0.0
+        scores = {get_safety_score_attribute(profile): 0.0 for profile in profiles}
 
     if counter is not None and counter % 1000 == 0:
         print(f"Processed {counter} edges...")
 
-    return (u, v, key, safety_score)
+    return (u, v, key, scores)
 
 def compute_edge_safety_scores(graph, crime_data):
     evaluator = PathSafetyEvaluator()
     evaluator.build_kdtree(crime_data)
+    profiles = get_crime_weight_profiles()
+    print(f"Scoring weight profiles: {', '.join(profiles)}")
 
     edge_list = list(graph.edges(keys=True, data=True))
     print(f"\nTotal {len(edge_list)} edges, starting parallel processing...")
@@ -81,7 +121,7 @@ def compute_edge_safety_scores(graph, crime_data):
         print(f"Processing edges {i} ~ {i + len(batch)}...")
 
         batch_result = Parallel(n_jobs=NUM_WORKERS, backend="threading")(
-            delayed(compute_safety_for_edge)(u, v, key, data, graph, evaluator, i + idx)
+            delayed(compute_safety_for_edge)(u, v, key, data, graph, evaluator, profiles, i + idx)
             for idx, (u, v, key, data) in enumerate(batch)
         )
 
@@ -93,20 +133,28 @@ def compute_edge_safety_scores(graph, crime_data):
             pickle.dump(batch_result, f)
         print(f"Cached: {batch_file}")
 
-    # Write safety scores into the graph
-    for u, v, key, score in results:
-        graph[u][v][key]["safety_score"] = score
+    # Write safety scores (one attribute per profile) into the graph
+    for u, v, key, scores in results:
+        graph[u][v][key].update(scores)
 
     return graph
 
 def save_graph(graph):
     print(f"\nSaving final graph to: {UPDATED_GRAPH_FILE}")
-    ox.save_graphml(graph, UPDATED_GRAPH_FILE)
+    # Write to a temporary file and rename it into place, so a reader of this
+    # file (e.g. the API when GRAPH_PATH points here) never sees it half-written
+    tmp_file = UPDATED_GRAPH_FILE + ".tmp"
+    ox.save_graphml(graph, tmp_file)
+    os.replace(tmp_file, UPDATED_GRAPH_FILE)
     print("Save completed.")
 
 def main():
+    parser = argparse.ArgumentParser(description="Score every edge of the walking network by nearby crime")
+    parser.add_argument("--input", help="Map GraphML to score (default: the pruned map unless the raw download is newer)")
+    args = parser.parse_args()
+
     start = time.time()
-    graph, crime_data = load_data()
+    graph, crime_data = load_data(args.input or default_graph_file())
     graph = compute_edge_safety_scores(graph, crime_data)
     save_graph(graph)
     print(f"\nAll done. Total time: {time.time() - start:.2f} seconds")
@@ -0,0 +1,180 @@
+import os
+import sys
+import time
+import logging
+import threading
+import networkx as nx
+
+# Add project root to sys.path
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(BASE_DIR, "..")))
+
+from utils.geo_utils import load_map_graph, ensure_safety_score_float
+from safety.crime_weights import get_profiles_from_attributes
+
+
+def detect_profiles(graph: nx.MultiDiGraph) -> list:
+    """List the safety weight profiles stored as `safety_score[_<profile>]` edge columns"""
+    for _, _, data in graph.edges(data=True):
+        return get_profiles_from_attributes(data)
+    return []
+
+
+class GraphSnapshot:
+    """An immutable, versioned safety graph that requests route against"""
+
+    def __init__(self, graph: nx.MultiDiGraph, version: str, path: str, mtime: float):
+        self.graph = graph
+        self.version = version
+        self.path = path
+        self.mtime = mtime
+        self.loaded_at = time.time()
+        self.profiles = detect_profiles(graph)
+
+    def info(self):
+        return {
+            "version": self.version,
+            "path": self.path,
+            "number_of_nodes": self.graph.number_of_nodes(),
+            "number_of_edges": self.graph.number_of_edges(),
+            "profiles": self.profiles,
+            "loaded_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.loaded_at)),
+        }
+
+
+def validate_graph(graph: nx.MultiDiGraph) -> None:
+    """
+    Reject graphs that would break routing before they are swapped in.
+    Raises ValueError describing the first problem found.
+    """
+    if graph.number_of_nodes() == 0 or graph.number_of_edges() == 0:
+        raise ValueError("graph has no nodes or edges")
+
+    for n, data in graph.nodes(data=True):
+        if "x" not in data or "y" not in data:
+            raise ValueError(f"node {n} has no coordinates")
+
+    for u, v, data in graph.edges(data=True):
+        if "length" not in data:
+            raise ValueError(f"edge ({u} -> {v}) has no length")
+        for attr, value in data.items():
+            if attr.startswith("safety_score") and not isinstance(value, float):
+                raise ValueError(f"edge ({u} -> {v}) has a non-float {attr}")
+
+
+class GraphRegistry:
+    """
+    Holds the current GraphSnapshot and replaces it without downtime.
+
+    A new graph is loaded and validated in a background thread while the old
+    one keeps serving; the swap is a single reference assignment under a lock.
+    Requests take a snapshot once with `current()` and keep routing on it, so
+    in-flight requests finish on the version they started with and the old
+    graph is freed when the last of them drops its reference.
+
+    Each uvicorn worker has its own registry: the file watcher is what keeps
+    all workers in step, the admin endpoint only reloads the worker it hits.
+    """
+
+    def __init__(self, graph_path: str):
+        self.graph_path = graph_path
+        self._lock = threading.Lock()
+        self._current = None
+        self._loader = None
+        self._generation = 0
+        self._last_error = None
+        self._watcher = None
+        self._stop_watching = threading.Event()
+
+    def current(self) -> GraphSnapshot:
+        snapshot = self._current
+        if snapshot is None:
+            raise RuntimeError("No safety graph loaded yet")
+        return snapshot
+
+    def load(self, path: str = None) -> GraphSnapshot:
+        """Load, validate and swap in a graph synchronously"""
+        path = path or self.graph_path
+        mtime = os.path.getmtime(path)
+        start = time.time()
+
+        graph = load_map_graph(path)
+        ensure_safety_score_float(graph)
+        validate_graph(graph)
+
+        with self._lock:
+            self._generation += 1
+            version = f"{self._generation}-{time.strftime('%Y%m%dT%H%M%S', time.localtime(mtime))}"
+            previous = self._current
+            self._current = GraphSnapshot(graph, version, path, mtime)
+            self._last_error = None
+
+        logging.info(
+            f"Graph version {version} swapped in after {time.time() - start:.1f}s "
+            f"(previous: {previous.version if previous else 'none'})"
+        )
+        return self._current
+
+    def reload_async(self, path: str = None) -> bool:
+        """
+        Start loading a new graph in the background.
+        Returns False if a reload is already in progress.
+        """
+        with self._lock:
+            if self._loader is not None and self._loader.is_alive():
+                return False
+            self._loader = threading.Thread(target=self._reload, args=(path,), name="graph-reload", daemon=True)
+            self._loader.start()
+        return True
+
+    def _reload(self, path):
+        try:
+            self.load(path)
+        except Exception as e:
+            self._last_error = f"{type(e).__name__}: {e}"
+            logging.error(f"Graph reload failed, keeping version {self._current.version if self._current else 'none'}: {e}")
+
+    def start_watching(self, interval: float = 60.0) -> None:
+        """Poll the graph file and reload it once a newer, fully written copy appears"""
+        if self._watcher is not None:
+            return
+        self._stop_watching.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name="graph-watch", daemon=True)
+        self._watcher.start()
+        logging.info(f"Watching {self.graph_path} for changes every {interval:.0f}s")
+
+    def stop_watching(self) -> None:
+        self._stop_watching.set()
+        self._watcher = None
+
+    def _watch(self, interval):
+        pending_mtime = None
+        attempted_mtime = None
+        while not self._stop_watching.wait(interval):
+            try:
+                mtime = os.path.getmtime(self.graph_path)
+            except OSError:
+                continue
+
+            current = self._current
+            if (current is not None and mtime <= current.mtime) or mtime == attempted_mtime:
+                pending_mtime = None
+                continue
+
+            # Only reload once the file has stopped changing for a full interval,
+            # so a graph that is still being written is never picked up
+            if mtime != pending_mtime:
+                pending_mtime = mtime
+                continue
+
+            pending_mtime = None
+            if self.reload_async():
+                attempted_mtime = mtime
+
+    def status(self):
+        return {
+            "current": self._current.info() if self._current else None,
+            "reloading": self._loader is not None and self._loader.is_alive(),
+            "last_error": self._last_error,
+            "watching": self._watcher is not None,
+        }
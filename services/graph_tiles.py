@@ -0,0 +1,446 @@
+"""
+Spatially partitioned safety graph tiles with on-demand loading.
+
+`build_tiles` cuts the safety graph into square geographic cells. Every edge is
+stored in the tile of each of its endpoints, so a tile also carries the nodes
+just across its border (its boundary overlay) and neighbouring tiles join up
+without gaps. Each tile is a directory of .npy arrays that are memory-mapped on
+load; `manifest.json` records the grid and the tiles that exist. Edges contracted
+by `prune_graph.py` keep their chain geometry, so routes and snapping on tiles
+match the whole graph.
+
+`TiledGraph` answers a query by loading only the tiles around its start and
+end into one graph of resident tiles, evicting the least recently used ones.
+Searches are confined to the resident tiles, so a route can be longer than the
+true optimum when the best path leaves them.
+
+    python services/graph_tiles.py --graph cache_london/london_safety_score_recent.graphml \
+        --out cache_london/tiles --tile-size-m 1000
+"""
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import logging
+import argparse
+import threading
+import contextlib
+from collections import OrderedDict, defaultdict
+import numpy as np
+import networkx as nx
+from scipy.spatial import cKDTree
+from shapely.geometry import LineString
+
+# Add project root to sys.path
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(BASE_DIR, "..")))
+
+from utils.metrics import span, TILE_CACHE
+from services.routing import chain_snap_points
+from safety.crime_weights import get_profiles_from_attributes
+
+TILES_DIR = os.path.join(BASE_DIR, "..", "cache_london", "tiles")
+MANIFEST_FILE = "manifest.json"
+METERS_PER_DEG_LAT = 111_320.0
+# Rings of extra tiles around the start/end bounding box, tried in order until routing succeeds
+DEFAULT_MARGINS = (1, 2, 4)
+
+
+def _tile_key(row, col):
+    return f"{row}_{col}"
+
+
+class TileGrid:
+    """Maps coordinates to tile cells of a fixed size in meters"""
+
+    def __init__(self, origin_lat, origin_lon, tile_size_m):
+        self.origin_lat = origin_lat
+        self.origin_lon = origin_lon
+        self.tile_size_m = tile_size_m
+        self.dlat = tile_size_m / METERS_PER_DEG_LAT
+        self.dlon = tile_size_m / (METERS_PER_DEG_LAT * math.cos(math.radians(origin_lat)))
+
+    def cell(self, lat, lon):
+        return math.floor((lat - self.origin_lat) / self.dlat), math.floor((lon - self.origin_lon) / self.dlon)
+
+    def to_dict(self):
+        return {"origin_lat": self.origin_lat, "origin_lon": self.origin_lon, "tile_size_m": self.tile_size_m}
+
+
+def build_tiles(graph, out_dir=TILES_DIR, tile_size_m=1000.0):
+    """Partition `graph` into tiles under `out_dir` and write the manifest"""
+    ys = [d["y"] for _, d in graph.nodes(data=True)]
+    xs = [d["x"] for _, d in graph.nodes(data=True)]
+    grid = TileGrid(min(ys), min(xs), tile_size_m)
+    cell_of = {n: grid.cell(d["y"], d["x"]) for n, d in graph.nodes(data=True)}
+
+    score_attrs = sorted({a for _, _, d in graph.edges(data=True) for a in d if a.startswith("safety_score")})
+
+    tile_edges = defaultdict(list)
+    for u, v, k, data in graph.edges(keys=True, data=True):
+        for cell in {cell_of[u], cell_of[v]}:
+            tile_edges[cell].append((u, v, k, data))
+
+    # Write into a fresh directory, then swap it in, so readers never see half a tile set
+    tmp_dir = out_dir.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    tiles = {}
+    for (row, col), edges in tile_edges.items():
+        nodes = sorted({n for u, v, _, _ in edges for n in (u, v)})
+        index = {n: i for i, n in enumerate(nodes)}
+        tile_dir = os.path.join(tmp_dir, _tile_key(row, col))
+        os.makedirs(tile_dir)
+
+        arrays = {
+            "nodes": np.array(nodes, dtype=np.int64),
+            "node_xy": np.array([(graph.nodes[n]["x"], graph.nodes[n]["y"]) for n in nodes], dtype=np.float64),
+            "boundary": np.array([cell_of[n] != (row, col) for n in nodes], dtype=bool),
+            "edge_uv": np.array([(index[u], index[v]) for u, v, _, _ in edges], dtype=np.int32).reshape(-1, 2),
+            "edge_key": np.array([k for _, _, k, _ in edges], dtype=np.int64),
+            "edge_length": np.array([float(d.get("length", 0.0)) for _, _, _, d in edges], dtype=np.float32),
+        }
+        for attr in score_attrs:
+            arrays[f"edge_{attr}"] = np.array([float(d.get(attr, 0.0)) for _, _, _, d in edges], dtype=np.float32)
+
+        # Geometry of contracted edges as a ragged array: the points of edge i
+        # are geom_xy[edge_geom_offsets[i]:edge_geom_offsets[i + 1]], none for plain edges
+        geoms = [
+            list(d["geometry"].coords) if "merged_edges" in d and d.get("geometry") is not None else []
+            for _, _, _, d in edges
+        ]
+        arrays["edge_merged"] = np.array([int(d.get("merged_edges", 1)) for _, _, _, d in edges], dtype=np.int32)
+        arrays["edge_geom_offsets"] = np.cumsum([0] + [len(g) for g in geoms]).astype(np.int64)
+        arrays["geom_xy"] = np.array([p[:2] for g in geoms for p in g], dtype=np.float64).reshape(-1, 2)
+
+        for name, array in arrays.items():
+            np.save(os.path.join(tile_dir, f"{name}.npy"), array)
+
+        tiles[_tile_key(row, col)] = {
+            "row": row,
+            "col": col,
+            "nodes": len(nodes),
+            "boundary_nodes": int(arrays["boundary"].sum()),
+            "edges": len(edges),
+        }
+
+    manifest = {
+        "version": time.strftime("%Y%m%dT%H%M%S"),
+        "grid": grid.to_dict(),
+        "score_attrs": score_attrs,
+        "edge_geometry": True,
+        "crs": graph.graph.get("crs", "epsg:4326"),
+        "tiles": tiles,
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return manifest
+
+
+class _ReadWriteLock:
+    """Any number of readers or one writer; a waiting writer holds off new readers"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextlib.contextmanager
+    def read(self):
+        with self._cond:
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+
+class TiledGraph:
+    """
+    Routes over tiles loaded on demand.
+
+    Every resident tile lives in one MultiDiGraph (`self.graph`) that tiles are
+    added to and evicted from, so queries around the same area reuse it instead
+    of assembling a graph each. Its node snapping index is rebuilt from
+    per-tile points whenever tiles change, rather than from the whole graph.
+    Nodes and edges shared by neighbouring tiles are reference counted, so
+    evicting a tile keeps those still used by another. Tiles are evicted least
+    recently used first once more than `max_tiles` are resident or the graph
+    holds more than `max_cached_edges` edges, but never while a query routes
+    over them.
+
+    A region may span at most `max_region_tiles` tiles, and never more than
+    `max_tiles`. Queries whose start and end need a larger region are refused
+    rather than paged through.
+
+    Searches see every resident tile, which always includes the region around
+    the query: the first margin in which all searches succeed wins, so a route
+    can be suboptimal when the best path leaves the resident tiles (e.g. a
+    bridge just outside them).
+    """
+
+    def __init__(self, tiles_dir=TILES_DIR, max_tiles=64, max_region_tiles=None, max_cached_edges=2_000_000):
+        with open(os.path.join(tiles_dir, MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+        self.tiles_dir = tiles_dir
+        self.version = f"tiles-{self.manifest['version']}"
+        self.profiles = get_profiles_from_attributes(self.manifest["score_attrs"])
+        grid = self.manifest["grid"]
+        self.grid = TileGrid(grid["origin_lat"], grid["origin_lon"], grid["tile_size_m"])
+        self.max_tiles = max_tiles
+        self.max_region_tiles = min(max_region_tiles or max_tiles, max_tiles)
+        self.max_cached_edges = max_cached_edges
+        self.graph = nx.MultiDiGraph(crs=self.manifest["crs"])
+        self._snap_scale = math.cos(math.radians(self.grid.origin_lat))
+        self._resident = OrderedDict()  # tile key -> memory-mapped tile arrays, in LRU order
+        self._pins = defaultdict(int)  # tile key -> queries currently routing over it
+        self._node_refs = defaultdict(int)  # node -> resident tiles containing it
+        self._edge_refs = defaultdict(int)  # (u, v, key) -> resident tiles containing it, for shared edges
+        self._edges = 0
+        self._lock = threading.Lock()  # guards the bookkeeping above
+        self._graph_lock = _ReadWriteLock()  # searches read self.graph, adding/evicting tiles writes it
+
+    def _load_tile(self, key):
+        tile_dir = os.path.join(self.tiles_dir, key)
+        names = ["nodes", "node_xy", "boundary", "edge_uv", "edge_key", "edge_length"]
+        names += [f"edge_{attr}" for attr in self.manifest["score_attrs"]]
+        if self.manifest.get("edge_geometry"):
+            names += ["edge_merged", "edge_geom_offsets", "geom_xy"]
+        return {name: np.load(os.path.join(tile_dir, f"{name}.npy"), mmap_mode="r") for name in names}
+
+    def tiles_for(self, orig, dest, margin):
+        """Keys of the existing tiles covering the start/end bounding box plus `margin` rings"""
+        (r1, c1), (r2, c2) = self.grid.cell(*orig), self.grid.cell(*dest)
+        keys = []
+        for row in range(min(r1, r2) - margin, max(r1, r2) + margin + 1):
+            for col in range(min(c1, c2) - margin, max(c1, c2) + margin + 1):
+                key = _tile_key(row, col)
+                if key in self.manifest["tiles"]:
+                    keys.append(key)
+        return tuple(keys)
+
+    @staticmethod
+    def _shared_edges(tile):
+        """
+        Which of a tile's edges touch its boundary overlay. Only those are also
+        stored by a neighbouring tile and need reference counts; the rest belong to this tile alone.
+        """
+        uv = tile["edge_uv"]
+        return (tile["boundary"][uv[:, 0]] | tile["boundary"][uv[:, 1]]).tolist()
+
+    def _add_tile(self, key):
+        """Merge a tile into the resident graph; edges shared with resident tiles are added once"""
+        tile = self._load_tile(key)
+        graph = self.graph
+        nodes = tile["nodes"].tolist()
+        new_nodes = []
+        for n, (x, y) in zip(nodes, tile["node_xy"].tolist()):
+            self._node_refs[n] += 1
+            if self._node_refs[n] == 1:
+                new_nodes.append((n, {"x": x, "y": y}))
+        graph.add_nodes_from(new_nodes)
+
+        score_attrs = self.manifest["score_attrs"]
+        columns = [tile["edge_length"].tolist()] + [tile[f"edge_{a}"].tolist() for a in score_attrs]
+        names = ["length"] + score_attrs
+        edges = zip(tile["edge_uv"].tolist(), tile["edge_key"].tolist(), self._shared_edges(tile), *columns)
+        for (ui, vi), k, shared, *values in edges:
+            if shared:
+                edge = (nodes[ui], nodes[vi], k)
+                self._edge_refs[edge] += 1
+                if self._edge_refs[edge] > 1:
+                    continue
+            graph.add_edge(nodes[ui], nodes[vi], key=k, **dict(zip(names, values)))
+            self._edges += 1
+
+        # This tile's share of the snapping index. Nodes and chains it shares
+        # with a neighbour are indexed by both tiles, which snaps them the same
+        xy = np.array(tile["node_xy"], dtype=float)
+        xy[:, 0] *= self._snap_scale
+        snap_xy, snap_targets, snap_positions = [xy], list(nodes), [None] * len(nodes)
+
+        # Tile sets built before edge geometry was stored have no contracted edges to expand
+        if "edge_merged" in tile:
+            offsets = tile["edge_geom_offsets"]
+            for i in np.flatnonzero(tile["edge_merged"] > 1).tolist():
+                if offsets[i + 1] - offsets[i] < 2:
+                    continue
+                (ui, vi), k = tile["edge_uv"][i].tolist(), int(tile["edge_key"][i])
+                geometry = LineString(tile["geom_xy"][offsets[i]:offsets[i + 1]])
+                graph.edges[nodes[ui], nodes[vi], k].update(merged_edges=int(tile["edge_merged"][i]), geometry=geometry)
+                chain_xy, chain_targets, chain_positions = chain_snap_points(
+                    nodes[ui], nodes[vi], k, geometry, self._snap_scale
+                )
+                snap_xy.append(chain_xy)
+                snap_targets.extend(chain_targets)
+                snap_positions.extend(chain_positions)
+
+        tile["snap_xy"] = np.concatenate(snap_xy)
+        tile["snap_targets"] = snap_targets
+        tile["snap_positions"] = snap_positions
+        self._resident[key] = tile
+
+    def _evict_tile(self, key):
+        """Drop a tile from the resident graph, keeping what other resident tiles still contain"""
+        tile = self._resident.pop(key)
+        nodes = tile["nodes"].tolist()
+        for (ui, vi), k, shared in zip(tile["edge_uv"].tolist(), tile["edge_key"].tolist(), self._shared_edges(tile)):
+            if shared:
+                edge = (nodes[ui], nodes[vi], k)
+                self._edge_refs[edge] -= 1
+                if self._edge_refs[edge]:
+                    continue
+                del self._edge_refs[edge]
+            self.graph.remove_edge(nodes[ui], nodes[vi], k)
+            self._edges -= 1
+        for n in nodes:
+            self._node_refs[n] -= 1
+            if not self._node_refs[n]:
+                del self._node_refs[n]
+                self.graph.remove_node(n)
+
+    def _update_snap_index(self):
+        """Rebuild the snapping index `routing.snap_to_nodes` uses for the resident graph"""
+        tiles = self._resident.values()
+        tree = cKDTree(np.concatenate([tile["snap_xy"] for tile in tiles]))
+        targets = [n for tile in tiles for n in tile["snap_targets"]]
+        positions = [p for tile in tiles for p in tile["snap_positions"]]
+        self.graph.graph["snap_index"] = (tree, targets, self._snap_scale, positions)
+
+    def _pin(self, keys):
+        """
+        Make sure all of `keys` are in the resident graph and pin them until
+        `_unpin`, so concurrent queries cannot evict them mid-search
+        """
+        with self._lock:
+            for key in keys:
+                self._pins[key] += 1
+                if key in self._resident:
+                    self._resident.move_to_end(key)
+            missing = [key for key in keys if key not in self._resident]
+        TILE_CACHE.inc(len(keys) - len(missing), cache="tile", result="hit")
+        if not missing:
+            return
+
+        try:
+            with self._graph_lock.write(), self._lock:
+                for key in missing:
+                    # Another query may have added it while this one waited for the lock
+                    if key in self._resident:
+                        continue
+                    TILE_CACHE.inc(cache="tile", result="miss")
+                    self._add_tile(key)
+                for key in [k for k in self._resident if k not in self._pins]:
+                    if len(self._resident) <= self.max_tiles and self._edges <= self.max_cached_edges:
+                        break
+                    self._evict_tile(key)
+                self._update_snap_index()
+        except Exception:
+            self._unpin(keys)
+            raise
+
+    def _unpin(self, keys):
+        with self._lock:
+            for key in keys:
+                self._pins[key] -= 1
+                if not self._pins[key]:
+                    del self._pins[key]
+
+    def route(self, orig, dest, compute, margins=DEFAULT_MARGINS):
+        """
+        Run `compute(graph)` on the resident graph with the region around
+        orig/dest loaded, widening the region while any of the returned routes
+        failed (e.g. the path leaves the region) and it stays within `max_region_tiles`.
+        """
+        result = None
+        for margin in margins:
+            keys = self.tiles_for(orig, dest, margin)
+            if not keys:
+                return {"error": "Start and end are outside the tiled area."}
+            if len(keys) > self.max_region_tiles:
+                if result is None:
+                    return {
+                        "error": f"Start and end are too far apart for tiled routing "
+                                 f"({len(keys)} tiles needed, limit {self.max_region_tiles})."
+                    }
+                logging.debug("Not widening past %d tiles (limit %d)", len(keys), self.max_region_tiles)
+                break
+            with span("load_tiles"):
+                self._pin(keys)
+            try:
+                with self._graph_lock.read():
+                    result = compute(self.graph)
+            finally:
+                self._unpin(keys)
+            if not any(isinstance(v, dict) and "error" in v for v in result.values()):
+                break
+            logging.debug("Routing failed on %d tiles (margin %d), widening the region", len(keys), margin)
+        return result
+
+    def status(self):
+        with self._lock:
+            return {
+                "version": self.version,
+                "tiles": len(self.manifest["tiles"]),
+                "profiles": self.profiles,
+                "resident_tiles": len(self._resident),
+                "resident_nodes": len(self._node_refs),
+                "resident_edges": self._edges,
+                "max_region_tiles": self.max_region_tiles,
+                "tile_size_m": self.grid.tile_size_m,
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partition a safety graph into memory-mapped tiles")
+    parser.add_argument("--graph", default=os.path.join(BASE_DIR, "..", "cache_london", "london_safety_score_recent.graphml"))
+    parser.add_argument("--out", default=TILES_DIR)
+    parser.add_argument("--tile-size-m", type=float, default=1000.0)
+    args = parser.parse_args()
+
+    from utils.geo_utils import load_map_graph, ensure_safety_score_float
+
+    start = time.time()
+    graph = load_map_graph(args.graph)
+    ensure_safety_score_float(graph)
+
+    print(f"Partitioning into {args.tile_size_m:.0f} m tiles...")
+    manifest = build_tiles(graph, args.out, args.tile_size_m)
+    tiles = manifest["tiles"].values()
+    print(
+        f"Wrote {len(manifest['tiles'])} tiles to {args.out}: "
+        f"{sum(t['nodes'] for t in tiles)} nodes ({sum(t['boundary_nodes'] for t in tiles)} boundary overlay), "
+        f"{sum(t['edges'] for t in tiles)} edges"
+    )
+    print(f"All done. Total time: {time.time() - start:.2f} seconds")
+
+
+if __name__ == "__main__":
+    main()
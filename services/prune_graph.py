@@ -0,0 +1,239 @@
+"""
+Graph pruning and simplification stage, run between `Map_download/map_download.py`
+and `generate_safety_graph.py`:
+
+  1. drop edges pedestrians cannot use (motorways, driveways, private or foot=no ways)
+  2. keep the largest strongly connected component
+  3. contract degree-2 chains into single edges, summing `length` and every
+     `safety_score` column and merging the geometry
+
+Contracted edges record how many original edges they replace in `merged_edges`,
+so scoring can still sample one crime score per original street segment.
+
+    python services/prune_graph.py
+    python services/prune_graph.py --input cache_london/london_safety_score.graphml --output pruned.graphml
+"""
+import os
+import sys
+import ast
+import time
+import random
+import argparse
+import networkx as nx
+import osmnx as ox
+from shapely.geometry import LineString
+
+# Add project root to sys.path
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(BASE_DIR, "..")))
+
+# === Path configuration ===
+RAW_GRAPH_FILE = os.path.join(BASE_DIR, "..", "Map_download", "london.graphml")
+PRUNED_GRAPH_FILE = os.path.join(BASE_DIR, "..", "Map_download", "london_pruned.graphml")
+
+# === Walkability rules ===
+NON_PEDESTRIAN_HIGHWAYS = {
+    "motorway", "motorway_link", "bus_guideway", "busway", "raceway",
+    "construction", "proposed", "abandoned", "escape",
+}
+NON_PEDESTRIAN_SERVICES = {"driveway", "parking_aisle", "drive-through", "emergency_access"}
+NO_ACCESS = {"private", "no"}
+FOOT_ALLOWED = {"yes", "designated", "permissive"}
+
+
+def _values(value):
+    """OSM tags may be a value, a list, or a list stringified by GraphML"""
+    if isinstance(value, str) and value.startswith("["):
+        try:
+            value = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            return {value}
+    if isinstance(value, (list, tuple, set)):
+        return {str(v) for v in value}
+    return {str(value)} if value is not None else set()
+
+
+def is_walkable(data):
+    """Whether an edge can be walked, judged from its OSM tags"""
+    foot = _values(data.get("foot"))
+    if "no" in foot:
+        return False
+    if foot & FOOT_ALLOWED:
+        return True
+    if _values(data.get("access")) & NO_ACCESS:
+        return False
+
+    highway = _values(data.get("highway"))
+    if highway and highway <= NON_PEDESTRIAN_HIGHWAYS:
+        return False
+    if highway == {"service"} and _values(data.get("service")) & NON_PEDESTRIAN_SERVICES:
+        return False
+    return True
+
+
+def drop_non_pedestrian_edges(graph):
+    drop = [(u, v, k) for u, v, k, d in graph.edges(keys=True, data=True) if not is_walkable(d)]
+    graph.remove_edges_from(drop)
+    graph.remove_nodes_from([n for n in list(graph.nodes) if graph.degree(n) == 0])
+    return graph
+
+
+def keep_largest_strongly_connected(graph):
+    largest = max(nx.strongly_connected_components(graph), key=len)
+    return graph.subgraph(largest).copy()
+
+
+def _is_interior(graph, n):
+    """
+    A node is a pure chain node if it joins exactly two neighbours, either as
+    a two-way street (one edge each way to each side) or a one-way pass-through.
+    """
+    preds, succs = set(graph.predecessors(n)), set(graph.successors(n))
+    if n in preds or n in succs:
+        return False
+    if len(preds | succs) != 2:
+        return False
+    in_deg, out_deg = graph.in_degree(n), graph.out_degree(n)
+    if preds == succs and in_deg == out_deg == 2:
+        return True
+    return len(preds) == 1 and len(succs) == 1 and preds != succs and in_deg == out_deg == 1
+
+
+def _merge_attributes(graph, chain):
+    """Attributes of the single edge replacing a chain of (u, v, key) edges"""
+    edges = [graph.edges[u, v, k] for u, v, k in chain]
+    merged = {}
+
+    keys = {a for d in edges for a in d} - {"geometry"}
+    for attr in keys:
+        values = [d[attr] for d in edges if attr in d]
+        if attr == "length" or attr.startswith("safety_score"):
+            merged[attr] = sum(float(v) for v in values)
+        elif attr == "merged_edges":
+            continue
+        else:
+            # osmnx convention: keep a single value, or the list of distinct ones
+            distinct = []
+            for v in values:
+                for item in (v if isinstance(v, list) else [v]):
+                    if item not in distinct:
+                        distinct.append(item)
+            merged[attr] = distinct[0] if len(distinct) == 1 else distinct
+
+    merged["merged_edges"] = sum(int(d.get("merged_edges", 1)) for d in edges)
+
+    coords = []
+    for (u, v, _), d in zip(chain, edges):
+        if "geometry" in d:
+            part = list(d["geometry"].coords)
+        else:
+            part = [(graph.nodes[u]["x"], graph.nodes[u]["y"]), (graph.nodes[v]["x"], graph.nodes[v]["y"])]
+        coords.extend(part if not coords else part[1:])
+    merged["geometry"] = LineString(coords)
+    return merged
+
+
+def contract_degree2_chains(graph):
+    """Replace every chain of interior nodes between two junctions with one edge per direction"""
+    interior = {n for n in graph.nodes if _is_interior(graph, n)}
+
+    new_edges = []
+    for start in graph.nodes:
+        if start in interior:
+            continue
+        for _, first, key in list(graph.out_edges(start, keys=True)):
+            if first not in interior:
+                continue
+            chain, prev, node = [(start, first, key)], start, first
+            while node in interior:
+                nxt = next(w for w in graph.successors(node) if w != prev)
+                chain.append((node, nxt, next(iter(graph[node][nxt]))))
+                prev, node = node, nxt
+            new_edges.append((start, node, chain))
+
+    merged = [(u, v, _merge_attributes(graph, chain)) for u, v, chain in new_edges]
+    graph.remove_nodes_from(interior)
+    for u, v, attrs in merged:
+        graph.add_edge(u, v, **attrs)
+    return graph
+
+
+def _bench_queries(graph, pairs):
+    """Mean shortest-path time in ms over (orig, dest) coordinate pairs"""
+    from services.routing import snap_to_nodes, _weight_function
+
+    weight_fn = _weight_function("hybrid")
+    start = time.perf_counter()
+    for orig, dest in pairs:
+        u, v = snap_to_nodes(graph, [orig, dest])
+        try:
+            nx.shortest_path(graph, u, v, weight=weight_fn)
+        except nx.NetworkXNoPath:
+            pass
+    return (time.perf_counter() - start) * 1000 / len(pairs)
+
+
+def _report(step, graph, before):
+    nodes, edges = graph.number_of_nodes(), graph.number_of_edges()
+    print(
+        f"{step:<34} {nodes:>9} nodes ({(nodes - before[0]) / before[0]:+.1%}), "
+        f"{edges:>9} edges ({(edges - before[1]) / before[1]:+.1%})"
+    )
+
+
+def prune_graph(graph):
+    """Run all pruning steps, printing the node and edge reduction of each"""
+    original = (graph.number_of_nodes(), graph.number_of_edges())
+    print(f"{'Input':<34} {original[0]:>9} nodes, {original[1]:>9} edges")
+
+    graph = drop_non_pedestrian_edges(graph)
+    _report("Non-pedestrian edges dropped", graph, original)
+
+    graph = keep_largest_strongly_connected(graph)
+    _report("Largest strongly connected comp.", graph, original)
+
+    graph = contract_degree2_chains(graph)
+    _report("Degree-2 chains contracted", graph, original)
+    return graph
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prune and simplify the walking network")
+    parser.add_argument("--input", default=RAW_GRAPH_FILE)
+    parser.add_argument("--output", default=PRUNED_GRAPH_FILE)
+    parser.add_argument("--benchmark-queries", type=int, default=20, help="Random queries timed before/after (0 skips)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input):
+        print(f"Map file does not exist: {args.input}")
+        sys.exit(1)
+
+    start = time.time()
+    print("Loading map...")
+    graph = ox.load_graphml(args.input)
+
+    pairs = []
+    if args.benchmark_queries > 0:
+        rng = random.Random(args.seed)
+        nodes = list(graph.nodes(data=True))
+        for _ in range(args.benchmark_queries):
+            (_, a), (_, b) = rng.sample(nodes, 2)
+            pairs.append(((a["y"], a["x"]), (b["y"], b["x"])))
+        before_ms = _bench_queries(graph, pairs)
+
+    graph = prune_graph(graph)
+
+    if pairs:
+        after_ms = _bench_queries(graph, pairs)
+        print(f"\nQuery time over {len(pairs)} queries: {before_ms:.1f} ms -> {after_ms:.1f} ms ({before_ms / after_ms:.2f}x speedup)")
+
+    print(f"\nSaving pruned graph to: {args.output}")
+    tmp_file = args.output + ".tmp"
+    ox.save_graphml(graph, tmp_file)
+    os.replace(tmp_file, args.output)
+    print(f"All done. Total time: {time.time() - start:.2f} seconds")
+
+
+if __name__ == "__main__":
+    main()
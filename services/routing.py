@@ -1,76 +1,337 @@
 import os
 import sys
+import math
+import heapq
+import logging
+import weakref
+import itertools
 import osmnx as ox
 import networkx as nx
 import numpy as np
 import pandas as pd
+from scipy.spatial import cKDTree
 
 # Add project root directory
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-GRAPH_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), "../cache_london/london_safety_score.graphml"))
-
-if not os.path.exists(GRAPH_FILE):
-    print(f"Error: GraphML file not found at {GRAPH_FILE}")
-    print("Please run `generate_safety_graph.py` first to generate the safety graph.")
-    sys.exit(1)
+from safety.crime_weights import get_safety_score_attribute
+from utils.metrics import span, SEARCH_NODES, SEARCHES, SNAP_INDEX_HITS, SNAP_INDEX_MISSES
 
-print("Loading London map data...")
-try:
-    graph = ox.load_graphml(GRAPH_FILE)
-    print("Map loaded successfully.")
-except Exception as e:
-    print(f"Error loading map: {e}")
-    sys.exit(1)
+GRAPH_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), "../cache_london/london_safety_score.graphml"))
 
 def convert_safety_values(graph):
     """Ensure all `safety_score` values are floats"""
     print("\nConverting `safety_score` values to float...")
     converted_count = 0
     for u, v, data in graph.edges(data=True):
-        if "safety_score" in data:
+        for attr in [a for a in data if a.startswith("safety_score")]:
             try:
-                data["safety_score"] = float(str(data["safety_score"]).replace(",", "").strip())
+                data[attr] = float(str(data[attr]).replace(",", "").strip())
                 converted_count += 1
             except ValueError:
-                print(f"Error converting `safety_score` on edge ({u} -> {v}): {repr(data['safety_score'])}")
-                data["safety_score"] = 0.0
+                print(f"Error converting `{attr}` on edge ({u} -> {v}): {repr(data[attr])}")
+                data[attr] = 0.0
     print(f"Successfully converted {converted_count} `safety_score` values.")
 
-convert_safety_values(graph)
 
-def get_route(graph, orig, dest, weight="length"):
-    orig_node = ox.distance.nearest_nodes(graph, orig[1], orig[0])
-    dest_node = ox.distance.nearest_nodes(graph, dest[1], dest[0])
+def load_graph(graph_file=GRAPH_FILE):
+    """
+    Load the safety graph for the command-line test below.
+    The API loads its own graph through the graph registry, so importing this
+    module must not load (or exit on a missing) graph.
+    """
+    if not os.path.exists(graph_file):
+        print(f"Error: GraphML file not found at {graph_file}")
+        print("Please run `generate_safety_graph.py` first to generate the safety graph.")
+        sys.exit(1)
 
-    print(f"\nStart node: {orig_node}, End node: {dest_node}")
+    print("Loading London map data...")
+    try:
+        graph = ox.load_graphml(graph_file)
+        print("Map loaded successfully.")
+    except Exception as e:
+        print(f"Error loading map: {e}")
+        sys.exit(1)
 
-    # Select weight function
+    convert_safety_values(graph)
+    return graph
+
+
+def _safety_score_getter(profile="default"):
+    """
+    Return a function reading an edge's safety score for a weight profile.
+    Profiles are extra columns on the same edges, so switching profile only
+    changes which attribute is read; graphs generated before a profile
+    existed fall back to the default `safety_score`.
+    """
+    attr = get_safety_score_attribute(profile)
+    if attr == "safety_score":
+        return lambda d: d.get("safety_score", 0.0)
+    return lambda d: d.get(attr, d.get("safety_score", 0.0))
+
+
+def _edge_cost(weight, profile="default"):
+    """Return a function computing the cost of a single edge's attribute dict"""
+    safety_score = _safety_score_getter(profile)
     if weight == "safety_score":
-        weight_fn = lambda u, v, d: d.get("safety_score", 0.0)
+        return safety_score
     elif weight == "hybrid":
-        weight_fn = lambda u, v, d: 0.5 * d.get("length", 1.0) + 0.5 * d.get("safety_score", 0.0)
+        return lambda d: 0.5 * d.get("length", 1.0) + 0.5 * safety_score(d)
+    return lambda d: d.get("length", 1.0)  # Default to shortest path
+
+
+def _weight_function(weight, profile="default"):
+    """
+    Build a networkx weight function for the given weight name.
+    On a MultiDiGraph networkx passes the dict of parallel edges, so take the cheapest one.
+    """
+    edge_cost = _edge_cost(weight, profile)
+    return lambda u, v, d: min(edge_cost(attr) for attr in d.values())
+
+
+# Spatial index per loaded graph; entries go away with the graph (e.g. after a hot reload)
+_snap_indexes = weakref.WeakKeyDictionary()
+
+
+def _is_contracted(data):
+    """Whether an edge replaces a chain of edges (see `prune_graph.py`) and carries its geometry"""
+    return "merged_edges" in data and data.get("geometry") is not None
+
+
+def chain_snap_points(u, v, key, geometry, scale):
+    """
+    Interior points of a contracted edge's geometry, scaled like the snapping
+    index, the end of the chain each of them stands for (the nearer one) and
+    its position on the chain as (u, v, key, vertex index)
+    """
+    coords = np.asarray(geometry.coords, dtype=float)[:, :2]
+    if len(coords) < 3:
+        return np.empty((0, 2)), [], []
+    coords[:, 0] *= scale
+    along = np.concatenate([[0.0], np.cumsum(np.hypot(*np.diff(coords, axis=0).T))])
+    targets = [u if a <= along[-1] - a else v for a in along[1:-1]]
+    return coords[1:-1], targets, [(u, v, key, i) for i in range(1, len(coords) - 1)]
+
+
+def _snap_index(graph):
+    """
+    KD-tree over node coordinates, built once per graph.
+    Coordinates are scaled to an equirectangular projection, which is exact
+    enough for nearest-node lookups at city scale.
+
+    The interior points of contracted chains are indexed too, each standing
+    for the nearer end of its chain, so a point on a long contracted street
+    snaps to a junction of that street rather than to whichever junction of
+    another street is closest in a straight line.
+
+    Graphs that change in place carry an index they keep up to date
+    themselves in `graph.graph["snap_index"]` (see graph_tiles.py).
+    """
+    index = graph.graph.get("snap_index") or _snap_indexes.get(graph)
+    if index is not None:
+        SNAP_INDEX_HITS.inc()
+        return index
+
+    SNAP_INDEX_MISSES.inc()
+    targets = list(graph.nodes)
+    ys = np.array([graph.nodes[n]["y"] for n in targets], dtype=float)
+    xs = np.array([graph.nodes[n]["x"] for n in targets], dtype=float)
+    scale = math.cos(math.radians(float(ys.mean())))
+    points = [np.column_stack([xs * scale, ys])]
+    positions = [None] * len(targets)
+
+    for u, v, key, data in graph.edges(keys=True, data=True):
+        if _is_contracted(data):
+            chain_points, chain_targets, chain_positions = chain_snap_points(u, v, key, data["geometry"], scale)
+            points.append(chain_points)
+            targets.extend(chain_targets)
+            positions.extend(chain_positions)
+
+    index = (cKDTree(np.concatenate(points)), targets, scale, positions)
+    _snap_indexes[graph] = index
+    return index
+
+
+def _snap(graph, points):
+    """
+    (node, chain position) for each (lat, lon) point: the nearest graph node,
+    and where on a contracted chain the point snapped ((u, v, key, vertex
+    index), or None when it snapped to a node directly)
+    """
+    tree, targets, scale, positions = _snap_index(graph)
+    _, idx = tree.query([(lon * scale, lat) for lat, lon in points])
+    return [(targets[i], positions[i]) for i in idx]
+
+
+def snap_to_nodes(graph, points):
+    """Nearest graph node for each (lat, lon) point"""
+    return [node for node, _ in _snap(graph, points)]
+
+
+def _route_points(graph, path, edge_cost):
+    """
+    (lat, lon) points along a node path, through the cheapest parallel edge of
+    each step. Contracted edges are expanded into the geometry of their chain;
+    other edges are drawn between their end nodes.
+    """
+    first = graph.nodes[path[0]]
+    points = [(float(first["y"]), float(first["x"]))]
+    for u, v in zip(path[:-1], path[1:]):
+        data = min(graph[u][v].values(), key=edge_cost)
+        if _is_contracted(data):
+            points.extend((float(y), float(x)) for x, y in list(data["geometry"].coords)[1:])
+        else:
+            points.append((float(graph.nodes[v]["y"]), float(graph.nodes[v]["x"])))
+    return points
+
+
+def _shared_chain(graph, orig, dest):
+    """
+    ((u, v, key), i, j) when two snapped points lie on the same contracted
+    chain, or one of them at an end of the other's chain: the chain edge and
+    the geometry vertex of each point on it. None otherwise.
+    """
+    (orig_node, orig_pos), (dest_node, dest_pos) = orig, dest
+    if orig_pos is None and dest_pos is None:
+        return None
+    u, v, key, _ = orig_pos or dest_pos
+    coords = list(graph.edges[u, v, key]["geometry"].coords)
+
+    def vertex(node, pos):
+        if pos is None:
+            return {u: 0, v: len(coords) - 1}.get(node)
+        pu, pv, pk, i = pos
+        if (pu, pv, pk) == (u, v, key):
+            return i
+        # The same street contracted in the other direction
+        if (pu, pv) == (v, u) and list(graph.edges[pu, pv, pk]["geometry"].coords) == coords[::-1]:
+            return len(coords) - 1 - i
+        return None
+
+    i, j = vertex(orig_node, orig_pos), vertex(dest_node, dest_pos)
+    if i is None or j is None:
+        return None
+    return (u, v, key), i, j
+
+
+def _chain_piece(graph, edge, i, j, edge_cost, safety_score):
+    """
+    (lat, lon) points, length and safety score of walking contracted `edge`
+    from geometry vertex i to vertex j, its length and score taken pro rata by
+    distance along the chain. Walking against the edge uses the street's edge
+    the other way; None when it has none (a one-way street).
+    """
+    u, v, key = edge
+    data = graph.edges[u, v, key]
+    coords = np.asarray(data["geometry"].coords, dtype=float)[:, :2]
+    if i > j:
+        backwards = list(data["geometry"].coords)[::-1]
+        reverse = [
+            d for d in (graph[v][u].values() if graph.has_edge(v, u) else [])
+            if _is_contracted(d) and list(d["geometry"].coords) == backwards
+        ]
+        if not reverse:
+            return None
+        data = min(reverse, key=edge_cost)
+
+    scaled = coords * [math.cos(math.radians(float(coords[:, 1].mean()))), 1.0]
+    along = np.concatenate([[0.0], np.cumsum(np.hypot(*np.diff(scaled, axis=0).T))])
+    share = abs(along[j] - along[i]) / along[-1] if along[-1] > 0 else 0.0
+
+    lo, hi = sorted((i, j))
+    points = [(float(y), float(x)) for x, y in coords[lo:hi + 1]]
+    if i > j:
+        points.reverse()
+    return points, share * float(data.get("length", 0.0)), share * float(safety_score(data))
+
+
+def _local_route(graph, orig, dest, edge_cost, safety_score):
+    """
+    The route between two snapped points that a search between their nodes
+    cannot find, because both points snapped to the same node: when they lie
+    on one contracted chain it walks the chain between them, otherwise from
+    the start's chain to the shared junction and out along the end's chain.
+    None for points a search has to connect.
+    """
+    shared = _shared_chain(graph, orig, dest)
+    if shared is not None:
+        pieces = [_chain_piece(graph, *shared, edge_cost, safety_score)]
+    elif orig[0] == dest[0]:
+        pieces = []
+        for (node, pos), to_node in ((orig, True), (dest, False)):
+            if pos is None:
+                continue
+            u, v, key, i = pos
+            end = 0 if node == u else len(graph.edges[u, v, key]["geometry"].coords) - 1
+            pieces.append(_chain_piece(graph, (u, v, key), *((i, end) if to_node else (end, i)), edge_cost, safety_score))
     else:
-        weight_fn = "length"  # Default to shortest path
+        return None
+    if any(piece is None for piece in pieces):
+        return None
+
+    node = graph.nodes[orig[0]]
+    points = [(float(node["y"]), float(node["x"]))] if not pieces else []
+    for piece_points, _, _ in pieces:
+        points.extend(piece_points[1:] if points else piece_points)
+    return {
+        "route": points,
+        "total_distance_m": sum(length for _, length, _ in pieces),
+        "total_safety_score": sum(score for _, _, score in pieces)
+    }
+
+
+def _counting(weight_fn):
+    """Wrap a weight function so the nodes a search reaches can be counted"""
+    reached = set()
+
+    def counted(u, v, d):
+        reached.add(u)
+        reached.add(v)
+        return weight_fn(u, v, d)
+
+    return counted, reached
+
+
+def get_route(graph, orig, dest, weight="length", profile="default"):
+    with span("snap"):
+        orig_snap, dest_snap = _snap(graph, [orig, dest])
+    orig_node, dest_node = orig_snap[0], dest_snap[0]
+
+    logging.debug("Start node: %s, End node: %s", orig_node, dest_node)
+
+    # Both points on one contracted street, or at the same junction: nothing to search
+    local = _local_route(graph, orig_snap, dest_snap, _edge_cost(weight, profile), _safety_score_getter(profile))
+    if local is not None:
+        return local
+
+    # Select weight function
+    weight_fn, reached = _counting(_weight_function(weight, profile))
 
     try:
-        best_path = nx.shortest_path(graph, orig_node, dest_node, weight=weight_fn)
+        with span("search"):
+            best_path = nx.shortest_path(graph, orig_node, dest_node, weight=weight_fn)
     except Exception as e:
+        SEARCHES.inc(weight=weight, outcome="error")
         return {"error": f"Error computing `{weight}` weighted path: {str(e)}"}
+    finally:
+        SEARCH_NODES.inc(len(reached), weight=weight)
 
     if len(best_path) < 2:
+        SEARCHES.inc(weight=weight, outcome="empty")
         return {"error": "No valid path found. Try different start or end points."}
 
-    print(f"`{weight}` path node count: {len(best_path)}")
+    SEARCHES.inc(weight=weight, outcome="ok")
+    logging.debug("`%s` path node count: %d, nodes reached: %d", weight, len(best_path), len(reached))
 
-    route_coords = [(float(graph.nodes[n]["y"]), float(graph.nodes[n]["x"])) for n in best_path]
-    route_gdf = ox.routing.route_to_gdf(graph, best_path)
+    with span("route_to_gdf"):
+        route_coords = _route_points(graph, best_path, _edge_cost(weight, profile))
+        route_gdf = ox.routing.route_to_gdf(graph, best_path)
 
-    print("\nRoute GeoDataFrame columns:")
-    print(route_gdf.columns)
-
-    total_distance = float(route_gdf["length"].sum())
-    total_score = float(route_gdf["safety_score"].sum()) if "safety_score" in route_gdf.columns else 0.0
+        total_distance = float(route_gdf["length"].sum())
+        score_attr = get_safety_score_attribute(profile)
+        if score_attr not in route_gdf.columns:
+            score_attr = "safety_score"
+        total_score = float(route_gdf[score_attr].sum()) if score_attr in route_gdf.columns else 0.0
 
     return {
         "route": route_coords,
@@ -78,7 +339,159 @@ def get_route(graph, orig, dest, weight="length"):
         "total_safety_score": total_score
     }
 
+
+def _tree_path(pred, node):
+    """Walk a Dijkstra predecessor map back from `node` to the search root"""
+    path = [node]
+    while pred.get(path[-1]):
+        path.append(pred[path[-1]][0])
+    return path
+
+
+def _summarize_path(graph, path, edge_cost, safety_score):
+    """Sum length and safety score along a node path, using the cheapest parallel edge"""
+    total_distance = 0.0
+    total_score = 0.0
+    for u, v in zip(path[:-1], path[1:]):
+        data = min(graph[u][v].values(), key=edge_cost)
+        total_distance += float(data.get("length", 0.0))
+        total_score += float(safety_score(data))
+
+    return {
+        "route": _route_points(graph, path, edge_cost),
+        "total_distance_m": total_distance,
+        "total_safety_score": total_score
+    }
+
+
+def _search_tree(graph, source, weight_fn, reverse=False, cutoff=math.inf, target=None, max_stretch=1.0, remaining=None):
+    """
+    Dijkstra tree from `source` (into `source` with `reverse`), in the
+    predecessor/distance form of `nx.dijkstra_predecessor_and_distance`.
+
+    Nodes further than `cutoff` are left out; settling `target` sets the cutoff
+    to `max_stretch` times its distance. Given `remaining`, the other tree's
+    distances, a node is only reached while its distance plus its remaining
+    distance fits the cutoff, so the tree covers the ellipse of nodes that can
+    lie on a path within the cutoff instead of the whole disc around `source`.
+    """
+    # The raw adjacency dicts, as networkx's own Dijkstra uses: the public views
+    # wrap every lookup and roughly double the cost of the search
+    adj = graph._pred if reverse else graph._succ
+    dist = {}
+    pred = {source: []}
+    best = {source: 0.0}
+    tie = itertools.count()
+    heap = [(0.0, next(tie), source)]
+    while heap:
+        d, _, v = heapq.heappop(heap)
+        if v in dist:
+            continue
+        if d > cutoff:
+            break
+        dist[v] = d
+        if v == target:
+            cutoff = d * max_stretch
+        for w, edges in adj[v].items():
+            vw_dist = d + (weight_fn(w, v, edges) if reverse else weight_fn(v, w, edges))
+            if w in dist or vw_dist > cutoff or vw_dist >= best.get(w, math.inf):
+                continue
+            if remaining is not None and (w not in remaining or vw_dist + remaining[w] > cutoff):
+                continue
+            best[w] = vw_dist
+            pred[w] = [v]
+            heapq.heappush(heap, (vw_dist, next(tie), w))
+    return pred, dist
+
+
+def get_alternative_routes(graph, orig, dest, weight="length", k=3, max_stretch=1.4, max_overlap=0.6, profile="default"):
+    """
+    Compute up to `k` diverse routes using the via-node method.
+
+    One forward search from the start and one backward search to the end are
+    shared by all candidates: every node v reached by both gives the via path
+    start -> v -> end with cost dist_f[v] + dist_b[v]. Candidates are taken in
+    cost order and accepted only if they cost at most `max_stretch` times the
+    optimum and share at most `max_overlap` of their cost with accepted routes.
+    The first route is always the optimal one.
+    """
+    with span("snap"):
+        orig_snap, dest_snap = _snap(graph, [orig, dest])
+    orig_node, dest_node = orig_snap[0], dest_snap[0]
+
+    edge_cost = _edge_cost(weight, profile)
+    edge_weight = _weight_function(weight, profile)
+
+    # Both points on one contracted street, or at the same junction: that walk is the only route
+    local = _local_route(graph, orig_snap, dest_snap, edge_cost, _safety_score_getter(profile))
+    if local is not None:
+        return {"routes": [{**local, "overlap": 0.0}]}
+    costs = {}  # (u, v) -> cost, shared by both trees and the overlap check
+
+    def weight_fn(u, v, d):
+        cost = costs.get((u, v))
+        if cost is None:
+            cost = costs[u, v] = edge_weight(u, v, d)
+        return cost
+
+    # The backward tree knows the optimum once it settles the start node and
+    # stops at the stretch limit; the forward tree then only explores nodes
+    # whose via path can stay within that limit
+    try:
+        with span("alternatives_search"):
+            pred_b, dist_b = _search_tree(
+                graph, dest_node, weight_fn, reverse=True, target=orig_node, max_stretch=max_stretch
+            )
+            if orig_node not in dist_b:
+                raise nx.NetworkXNoPath(f"Node {dest_node} not reachable from {orig_node}")
+            cutoff = dist_b[orig_node] * max_stretch
+            pred_f, dist_f = _search_tree(graph, orig_node, weight_fn, cutoff=cutoff, remaining=dist_b)
+    except Exception as e:
+        SEARCHES.inc(weight=weight, outcome="error")
+        return {"error": f"Error computing `{weight}` weighted path: {str(e)}"}
+    SEARCH_NODES.inc(len(dist_f) + len(dist_b), weight=weight)
+
+    candidates = sorted(
+        (dist_f[v] + dist_b[v], v) for v in dist_f.keys() & dist_b.keys()
+        if dist_f[v] + dist_b[v] <= cutoff
+    )
+
+    routes = []
+    selected_edges = {}  # (u, v) -> cost, for edges on accepted routes
+    seen = set()
+    for cost, via in candidates:
+        if len(routes) >= k:
+            break
+        # Nodes on an already evaluated path mostly yield the same path again
+        if via in seen:
+            continue
+
+        path = _tree_path(pred_f, via)[::-1] + _tree_path(pred_b, via)[1:]
+        seen.update(path)
+        if len(path) < 2 or len(set(path)) != len(path):
+            continue  # Via path loops back on itself
+
+        edges = list(zip(path[:-1], path[1:]))
+        shared = sum(selected_edges[e] for e in edges if e in selected_edges)
+        if routes and cost > 0 and shared / cost > max_overlap:
+            continue
+
+        route = _summarize_path(graph, path, edge_cost, _safety_score_getter(profile))
+        route["overlap"] = round(shared / cost, 3) if cost > 0 else 0.0
+        routes.append(route)
+        selected_edges.update({(u, v): weight_fn(u, v, graph[u][v]) for u, v in edges})
+
+    if not routes:
+        SEARCHES.inc(weight=weight, outcome="empty")
+        return {"error": "No valid path found. Try different start or end points."}
+
+    SEARCHES.inc(weight=weight, outcome="ok")
+    logging.debug("`%s` alternatives: %d routes from %d via candidates", weight, len(routes), len(candidates))
+    return {"routes": routes}
+
 if __name__ == "__main__":
+    graph = load_graph()
+
     test_start = (51.5308, -0.1238)  # King's Cross Station
     test_end = (51.5033, -0.1195)    # London Eye
 
@@ -93,3 +506,11 @@ if __name__ == "__main__":
     print("\nTesting Hybrid Path (50% shortest + 50% safety_score)...")
     result = get_route(graph, test_start, test_end, weight="hybrid")
     print(result)
+
+    print("\nTesting Safest Path at night (safety_score_night profile)...")
+    result = get_route(graph, test_start, test_end, weight="safety_score", profile="night")
+    print(result)
+
+    print("\nTesting 3 Alternative Routes (via-node method)...")
+    result = get_alternative_routes(graph, test_start, test_end, weight="length", k=3)
+    print(result)
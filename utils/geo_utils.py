@@ -1,4 +1,5 @@
 import os
+import zlib
 import networkx as nx
 import osmnx as ox
 import geopy
@@ -19,26 +20,66 @@ def load_map_graph(graph_path: str) -> nx.MultiDiGraph:
 
 def ensure_safety_score_float(graph: nx.MultiDiGraph) -> None:
     """
-    Ensure that all edges in the graph have 'safety_score' as float type.
+    Ensure that all edges in the graph have 'safety_score' (and the per-profile
+    'safety_score_<profile>' columns) as float type.
     """
     print("Checking 'safety_score' data type...")
     count = 0
     for u, v, k, data in graph.edges(keys=True, data=True):
-        if "safety_score" in data:
+        for attr in [a for a in data if a.startswith("safety_score")]:
             try:
-                graph[u][v][k]["safety_score"] = float(data["safety_score"])
+                data[attr] = float(data[attr])
                 count += 1
             except ValueError:
-                graph[u][v][k]["safety_score"] = 0.0
+                data[attr] = 0.0
     print(f"'safety_score' data check completed. ({count} values converted)")
 
 
+# Landmarks answered by the stub geocoder (GEOCODER=stub), used for load tests
+STUB_PLACES = {
+    "King's Cross Station": (51.5308, -0.1238),
+    "London Eye": (51.5033, -0.1195),
+    "British Museum": (51.5194, -0.1270),
+    "Tower of London": (51.5081, -0.0759),
+    "Buckingham Palace": (51.5014, -0.1419),
+    "Trafalgar Square": (51.5080, -0.1281),
+    "St Paul's Cathedral": (51.5138, -0.0984),
+    "Covent Garden": (51.5117, -0.1240),
+    "Liverpool Street Station": (51.5178, -0.0823),
+    "Waterloo Station": (51.5031, -0.1132),
+    "Camden Market": (51.5415, -0.1466),
+    "Hyde Park Corner": (51.5027, -0.1527),
+    "Borough Market": (51.5055, -0.0910),
+    "Paddington Station": (51.5154, -0.1755),
+    "Angel": (51.5322, -0.1058),
+}
+
+
+def stub_geocode_location(place_name):
+    """
+    Offline stand-in for the geocoder: known landmarks map to their coordinates,
+    any other name to a stable pseudo-random point in central London.
+    """
+    for name, (lat, lon) in STUB_PLACES.items():
+        if name.lower() in place_name.lower():
+            return {"latitude": lat, "longitude": lon}
+
+    digest = zlib.crc32(place_name.encode("utf-8"))
+    lat = 51.48 + (digest & 0xFFFF) / 0xFFFF * 0.06
+    lon = -0.20 + (digest >> 16) / 0xFFFF * 0.15
+    return {"latitude": round(lat, 6), "longitude": round(lon, 6)}
+
+
 def geocode_location(place_name):
     """
     Use the geocoding API to get the latitude and longitude of a place.
+    Set GEOCODER=stub to answer from `stub_geocode_location` without network access.
     :param place_name: e.g., 'London'
     :return: {'latitude': float, 'longitude': float} or {'error': str}
     """
+    if os.environ.get("GEOCODER") == "stub":
+        return stub_geocode_location(place_name)
+
     geolocator = geopy.geocoders.Nominatim(user_agent="map_service")
 
     try:
@@ -0,0 +1,201 @@
+import os
+import sys
+import time
+import logging
+import threading
+import traceback
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+
+# Latency buckets in seconds, shared by all histograms
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Requests slower than this (ms) log their per-stage breakdown
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", "1000"))
+# Opt-in sampling profiler for slow requests, and its sampling interval
+PROFILE_SLOW_REQUESTS = os.environ.get("PROFILE_SLOW_REQUESTS", "0") == "1"
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+
+_registry = []
+_trace = threading.local()
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    """A monotonically increasing Prometheus counter with optional labels"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """A Prometheus histogram with fixed buckets and optional labels"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            row = self._values.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, row in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, row):
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', f'{bound:g}'))} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {row[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {row[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {row[-1]}")
+        return lines
+
+
+def render_metrics():
+    """All registered metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# === Metrics of the routing hot path ===
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency", ("path",))
+REQUESTS = Counter("http_requests_total", "HTTP requests served", ("path", "status"))
+STAGE_LATENCY = Histogram("route_stage_duration_seconds", "Time spent per routing stage", ("stage",))
+SEARCH_NODES = Counter("route_search_nodes_total", "Nodes reached by route searches (settled plus frontier)", ("weight",))
+SEARCHES = Counter("route_searches_total", "Route searches run", ("weight", "outcome"))
+SNAP_INDEX_HITS = Counter("snap_index_cache_hits_total", "Node snapping lookups served by a cached spatial index")
+SNAP_INDEX_MISSES = Counter("snap_index_cache_misses_total", "Node snapping lookups that had to build a spatial index")
+TILE_CACHE = Counter("tile_cache_lookups_total", "Graph tile lookups (hit: already in the resident graph)", ("cache", "result"))
+
+
+@contextmanager
+def span(stage):
+    """Time one stage of the hot path into STAGE_LATENCY and the current request trace"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_LATENCY.observe(elapsed, stage=stage)
+        stages = getattr(_trace, "stages", None)
+        if stages is not None:
+            stages[stage] = stages.get(stage, 0.0) + elapsed
+
+
+class _Sampler(threading.Thread):
+    """
+    One background thread sampling, at a fixed interval, the stacks of every
+    thread currently inside a profiled request. Samples are kept per thread id.
+    """
+
+    def __init__(self, interval):
+        super().__init__(name="slow-request-sampler", daemon=True)
+        self.interval = interval
+        self._samples = {}  # thread id -> StackCounter
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+
+    def track(self, thread_id):
+        with self._lock:
+            self._samples[thread_id] = StackCounter()
+            self._active.set()
+
+    def untrack(self, thread_id):
+        with self._lock:
+            samples = self._samples.pop(thread_id, StackCounter())
+            if not self._samples:
+                self._active.clear()
+        return samples
+
+    def run(self):
+        while True:
+            # Idle without waking up while no profiled request is running
+            self._active.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, samples in self._samples.items():
+                    frame = frames.get(thread_id)
+                    if frame is None:
+                        continue
+                    stack = traceback.extract_stack(frame, limit=8)
+                    samples[" <- ".join(f"{f.name} ({os.path.basename(f.filename)}:{f.lineno})" for f in reversed(stack))] += 1
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def _shared_sampler():
+    """The process-wide sampler, started on first use"""
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = _Sampler(PROFILE_INTERVAL_MS / 1000)
+            _sampler.start()
+    return _sampler
+
+
+@contextmanager
+def request_trace(name):
+    """
+    Collect the per-stage timings of one request handled on the current thread.
+    Requests slower than SLOW_REQUEST_MS log their breakdown; with
+    PROFILE_SLOW_REQUESTS=1 they also log the most sampled stacks.
+    """
+    _trace.stages = {}
+    thread_id = threading.get_ident()
+    sampler = _shared_sampler() if PROFILE_SLOW_REQUESTS else None
+    if sampler is not None:
+        sampler.track(thread_id)
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        stages, _trace.stages = _trace.stages, None
+        samples = sampler.untrack(thread_id) if sampler is not None else None
+
+        if elapsed_ms > SLOW_REQUEST_MS:
+            breakdown = ", ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in stages.items())
+            logging.warning("Slow request %s: %.1fms (%s)", name, elapsed_ms, breakdown)
+            if samples:
+                for stack, count in samples.most_common(10):
+                    logging.warning("  %4d samples: %s", count, stack)
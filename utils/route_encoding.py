@@ -0,0 +1,187 @@
+import gzip
+import json
+import base64
+import struct
+from fastapi import Response
+
+# Optional fast paths: orjson for serialization, brotli for compression
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+FORMATS = ("json", "polyline", "binary")
+# Bodies smaller than this are sent uncompressed; compression would not pay off
+MIN_COMPRESS_BYTES = 1024
+BINARY_MAGIC = b"LSR1"
+BINARY_SCALE = 1_000_000  # microdegrees
+
+
+def encode_polyline(coords, precision=5):
+    """Google encoded polyline of a list of (lat, lon) points"""
+    factor = 10 ** precision
+    out = []
+    prev_lat = prev_lon = 0
+    for lat, lon in coords:
+        lat_i, lon_i = round(lat * factor), round(lon * factor)
+        for delta in (lat_i - prev_lat, lon_i - prev_lon):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                out.append(chr((0x20 | (value & 0x1F)) + 63))
+                value >>= 5
+            out.append(chr(value + 63))
+        prev_lat, prev_lon = lat_i, lon_i
+    return "".join(out)
+
+
+def _varint(value, out):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def encode_binary(coords):
+    """
+    Compact binary route, base64 encoded for the JSON envelope:
+    magic "LSR1", point count (uint32 LE), first point as int32 microdegrees
+    (lat, lon), then zigzag varint microdegree deltas for each further point.
+    """
+    points = [(round(lat * BINARY_SCALE), round(lon * BINARY_SCALE)) for lat, lon in coords]
+    out = bytearray(BINARY_MAGIC)
+    out += struct.pack("<I", len(points))
+    if points:
+        out += struct.pack("<ii", *points[0])
+        for (lat0, lon0), (lat1, lon1) in zip(points[:-1], points[1:]):
+            for delta in (lat1 - lat0, lon1 - lon0):
+                _varint((delta << 1) ^ (delta >> 63), out)
+    return base64.b64encode(bytes(out)).decode("ascii")
+
+
+def _route_dicts(result):
+    """Every route dict (with a `route` point list) in a routes response"""
+    for value in result.values():
+        if isinstance(value, dict) and "route" in value:
+            yield value
+        elif isinstance(value, dict) and isinstance(value.get("routes"), list):
+            yield from (r for r in value["routes"] if "route" in r)
+
+
+def split_shared_segments(routes):
+    """
+    Split routes into segments so stretches shared by several routes are stored once.
+    An edge's signature is the set of routes that traverse it; each route is cut
+    wherever the signature changes. Returns (segments, per-route segment ids);
+    consecutive segments of a route share their joint point.
+    """
+    edge_sets = [set(zip(r[:-1], r[1:])) for r in routes]
+    segment_ids, route_segments = {}, []
+
+    for route in routes:
+        if len(route) < 2:
+            route_segments.append([segment_ids.setdefault(tuple(route), len(segment_ids))] if route else [])
+            continue
+
+        ids, run, run_sig = [], [route[0]], None
+        for edge in zip(route[:-1], route[1:]):
+            sig = tuple(j for j, edges in enumerate(edge_sets) if edge in edges)
+            if run_sig is not None and sig != run_sig:
+                ids.append(segment_ids.setdefault(tuple(run), len(segment_ids)))
+                run = [edge[0]]
+            run.append(edge[1])
+            run_sig = sig
+        ids.append(segment_ids.setdefault(tuple(run), len(segment_ids)))
+        route_segments.append(ids)
+
+    segments = [None] * len(segment_ids)
+    for points, i in segment_ids.items():
+        segments[i] = list(points)
+    return segments, route_segments
+
+
+def encode_routes(result, fmt):
+    """
+    Rewrite the `route` point lists of a response for a compact format.
+    Shared stretches are deduplicated into a top-level `segments` list and each
+    route lists the segment ids it is made of, in order.
+    """
+    if fmt == "json":
+        return result
+
+    encode = encode_polyline if fmt == "polyline" else encode_binary
+    route_dicts = list(_route_dicts(result))
+    points = [[tuple(p) for p in r["route"]] for r in route_dicts]
+    segments, route_segments = split_shared_segments(points)
+
+    for route, ids in zip(route_dicts, route_segments):
+        del route["route"]
+        route["segments"] = ids
+
+    return {**result, "format": fmt, "segments": [encode(s) for s in segments]}
+
+
+def dumps(content):
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def parse_accept_encoding(header):
+    """
+    Map each coding named in an Accept-Encoding header to its q-value
+    (default 1). Malformed q-values count as 0, i.e. not acceptable.
+    """
+    qualities = {}
+    for item in (header or "").split(","):
+        coding, *params = [p.strip() for p in item.split(";")]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities[coding.lower()] = q
+    return qualities
+
+
+def choose_encoding(header, available):
+    """
+    The coding of `available` (in server preference order) with the highest
+    q-value above 0, or None. `*` covers codings not named explicitly.
+    """
+    qualities = parse_accept_encoding(header)
+    best, best_q = None, 0.0
+    for coding in available:
+        q = qualities.get(coding, qualities.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def render_routes_response(result, fmt="json", accept_encoding=None):
+    """
+    Serialize a routes response in the requested format, compressed with brotli
+    or gzip when the client accepts it and the body is large enough.
+    """
+    body = dumps(encode_routes(result, fmt))
+    headers = {"Vary": "Accept-Encoding"}
+
+    if len(body) >= MIN_COMPRESS_BYTES:
+        encoding = choose_encoding(accept_encoding, ("br", "gzip") if brotli is not None else ("gzip",))
+        if encoding == "br":
+            body = brotli.compress(body, quality=5)
+            headers["Content-Encoding"] = "br"
+        elif encoding == "gzip":
+            body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+
+    return Response(content=body, media_type="application/json", headers=headers)